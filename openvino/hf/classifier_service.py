@@ -0,0 +1,296 @@
+# /qompassai/intel/openvino/hf/classifier_service.py
+# Qompass AI Hugging Face Batched Classifier Service
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import argparse
+import bisect
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+MODEL = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+BUCKETS = (16, 32, 64, 128, 256, 512)
+
+
+def softmax(logits):
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def pad_batch(token_ids, input_names, pad_token_id=0, shape=None):
+    # dynamic padding: only up to the longest sequence in this batch, which bucketing keeps close to the shortest;
+    # with a static ``shape`` the batch is padded out to exactly (batch, seq_len)
+    rows, length = shape or (len(token_ids), max(len(ids) for ids in token_ids))
+    input_ids = np.full((rows, length), pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((rows, length), dtype=np.int64)
+    # filler rows attend to one token so their (discarded) outputs stay finite
+    attention_mask[len(token_ids) :, 0] = 1
+    for row, ids in enumerate(token_ids):
+        input_ids[row, : len(ids)] = ids
+        attention_mask[row, : len(ids)] = 1
+    inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+    return {name: value for name, value in inputs.items() if name in input_names}
+
+
+def parse_shape(value):
+    batch, seq_len = value.lower().split("x")
+    return int(batch), int(seq_len)
+
+
+class StaticShapeBuckets:
+    """The classifier reshaped and compiled once per (batch, seq_len) at startup, so requests never hit a dynamic shape
+    or a compile; each batch goes to the smallest precompiled shape it fits in."""
+
+    def __init__(self, model_path, shapes, device="CPU", config=None, core=None):
+        import openvino as ov
+
+        if core is None:
+            core = ov.Core()
+        self.shapes = sorted(set(shapes), key=lambda shape: (shape[0] * shape[1], shape[1]))
+        self.compiled_models = {}
+        self.queues = {}
+        self.batches = dict.fromkeys(self.shapes, 0)
+        start = time.perf_counter()
+        for batch, seq_len in self.shapes:
+            model = core.read_model(str(model_path))
+            model.reshape({port: ov.PartialShape([batch, seq_len]) for port in model.inputs})
+            compiled_model = core.compile_model(model, device, config or {"PERFORMANCE_HINT": "THROUGHPUT"})
+            self.compiled_models[batch, seq_len] = compiled_model
+            self.queues[batch, seq_len] = ov.AsyncInferQueue(compiled_model, compiled_model.get_property("OPTIMAL_NUMBER_OF_INFER_REQUESTS"))
+        print(f"✅ {len(self.shapes)} static shapes compiled in {time.perf_counter() - start:.1f} s")
+
+    @property
+    def seq_lens(self):
+        return tuple(sorted({seq_len for _, seq_len in self.shapes}))
+
+    def max_batch(self, seq_len):
+        return max((batch for batch, bucket_seq_len in self.shapes if bucket_seq_len >= seq_len), default=0)
+
+    def route(self, batch, seq_len):
+        for shape in self.shapes:
+            if shape[0] >= batch and shape[1] >= seq_len:
+                return shape
+        return None
+
+    def set_callback(self, callback):
+        for infer_queue in self.queues.values():
+            infer_queue.set_callback(callback)
+
+    def wait_all(self):
+        for infer_queue in self.queues.values():
+            infer_queue.wait_all()
+
+
+class _Item:
+    __slots__ = ("text", "future", "submitted_at", "token_ids")
+
+    def __init__(self, text):
+        self.text = text
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+        self.token_ids = None
+
+
+class ClassifierService:
+    """Batches single-text requests for the exported sequence classifier.
+
+    Texts are tokenized in bulk, grouped into length buckets and padded per batch. A bucket is sent as soon as it
+    holds ``max_batch_size`` texts or its oldest text has waited ``max_wait_ms``. Batches run on an AsyncInferQueue,
+    so several are in flight at once. With ``static_shapes`` the length buckets are the precompiled sequence lengths
+    and every batch is padded to the precompiled shape it is routed to.
+    """
+
+    def __init__(
+        self,
+        model_path="models/model.xml",
+        tokenizer=MODEL,
+        device="CPU",
+        max_batch_size=32,
+        max_wait_ms=5,
+        buckets=BUCKETS,
+        labels=None,
+        compiled_model=None,
+        stats_window=100000,
+        static_shapes=None,
+    ):
+        import openvino as ov
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer) if isinstance(tokenizer, str) else tokenizer
+        if labels is None:
+            labels = AutoConfig.from_pretrained(tokenizer).id2label if isinstance(tokenizer, str) else {}
+        self.labels = labels
+        self.static = None
+        if static_shapes:
+            self.static = StaticShapeBuckets(model_path, static_shapes, device)
+            self.static.set_callback(self._on_done)
+            compiled_model = next(iter(self.static.compiled_models.values()))
+            buckets = self.static.seq_lens
+        elif compiled_model is None:
+            core = ov.Core()
+            compiled_model = core.compile_model(str(model_path), device, {"PERFORMANCE_HINT": "THROUGHPUT"})
+        self.compiled_model = compiled_model
+        self.input_names = {name for port in compiled_model.inputs for name in port.get_names()}
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.buckets = tuple(sorted(buckets))
+        self.infer_queue = None
+        if self.static is None:
+            self.infer_queue = ov.AsyncInferQueue(compiled_model, compiled_model.get_property("OPTIMAL_NUMBER_OF_INFER_REQUESTS"))
+            self.infer_queue.set_callback(self._on_done)
+        self.latencies = deque(maxlen=stats_window)
+        self.completed = 0
+        self.batches = 0
+        self.padded_tokens = 0
+        self.real_tokens = 0
+        self._incoming = queue.Queue()
+        self._pending = {bound: deque() for bound in self.buckets}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="classifier-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text) -> Future:
+        item = _Item(text)
+        self._incoming.put(item)
+        return item.future
+
+    def classify(self, texts):
+        return [future.result() for future in [self.submit(text) for text in texts]]
+
+    def close(self):
+        self._closed = True
+        self._incoming.put(None)
+        self._thread.join()
+        (self.static or self.infer_queue).wait_all()
+
+    def _batch_limit(self, bucket):
+        return min(self.max_batch_size, self.static.max_batch(bucket)) if self.static is not None else self.max_batch_size
+
+    def _tokenize(self, items):
+        encoded = self.tokenizer([item.text for item in items], truncation=True, max_length=self.buckets[-1], padding=False)
+        for item, ids in zip(items, encoded["input_ids"]):
+            item.token_ids = ids
+            self._pending[self.buckets[min(bisect.bisect_left(self.buckets, len(ids)), len(self.buckets) - 1)]].append(item)
+
+    def _dispatch(self, items):
+        token_ids = [item.token_ids for item in items]
+        shape, infer_queue = None, self.infer_queue
+        if self.static is not None:
+            shape = self.static.route(len(token_ids), max(len(ids) for ids in token_ids))
+            infer_queue = self.static.queues[shape]
+        inputs = pad_batch(token_ids, self.input_names, self.tokenizer.pad_token_id or 0, shape)
+        with self._lock:
+            self.batches += 1
+            self.real_tokens += sum(len(ids) for ids in token_ids)
+            self.padded_tokens += next(iter(inputs.values())).size
+            if shape is not None:
+                self.static.batches[shape] += 1
+        # blocks while every infer request is busy, which is the backpressure for the whole service
+        infer_queue.start_async(inputs, items)
+
+    def _on_done(self, request, items):
+        scores = softmax(request.get_output_tensor(0).data.astype(np.float32))
+        done = time.perf_counter()
+        for item, item_scores in zip(items, scores):
+            index = int(item_scores.argmax())
+            item.future.set_result({"label": self.labels.get(index, index), "score": float(item_scores[index]), "scores": item_scores.tolist()})
+        with self._lock:
+            self.completed += len(items)
+            self.latencies.extend(done - item.submitted_at for item in items)
+
+    def _next_deadline(self):
+        oldest = [bucket[0].submitted_at for bucket in self._pending.values() if bucket]
+        return min(oldest) + self.max_wait if oldest else None
+
+    def _run(self):
+        while True:
+            deadline = self._next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            items = []
+            try:
+                items.append(self._incoming.get(timeout=timeout))
+                while len(items) < 4 * self.max_batch_size:
+                    items.append(self._incoming.get_nowait())
+            except queue.Empty:
+                pass
+            closing = None in items
+            items = [item for item in items if item is not None]
+            if items:
+                try:
+                    self._tokenize(items)
+                except Exception as exc:
+                    for item in items:
+                        item.future.set_exception(exc)
+            now = time.perf_counter()
+            for bound, bucket in self._pending.items():
+                limit = self._batch_limit(bound)
+                while len(bucket) >= limit:
+                    self._dispatch([bucket.popleft() for _ in range(limit)])
+                if bucket and (closing or now - bucket[0].submitted_at >= self.max_wait):
+                    self._dispatch(list(bucket))
+                    bucket.clear()
+            if closing:
+                return
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+            elapsed = time.perf_counter() - self._started_at
+            return {
+                "completed": self.completed,
+                "batches": self.batches,
+                "avg_batch_size": self.completed / self.batches if self.batches else 0.0,
+                "sentences_per_second": self.completed / elapsed if elapsed else 0.0,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "padding_waste_ratio": 1 - self.real_tokens / self.padded_tokens if self.padded_tokens else 0.0,
+                **({"shape_batches": {f"{batch}x{seq_len}": count for (batch, seq_len), count in self.static.batches.items()}} if self.static else {}),
+            }
+
+
+def stream_file(service, path, output_path=None, rate=None):
+    # Feeds the lines of a local file to the service as a stream (optionally at ``rate`` texts/s) and reports throughput.
+    futures = []
+    start = time.perf_counter()
+    with open(path) as texts:
+        for index, line in enumerate(texts):
+            text = line.rstrip("\n")
+            if not text:
+                continue
+            if rate:
+                time.sleep(max(0.0, start + index / rate - time.perf_counter()))
+            futures.append((text, service.submit(text)))
+    results = [(text, future.result()) for text, future in futures]
+    elapsed = time.perf_counter() - start
+    if output_path:
+        with open(output_path, "w") as output:
+            for text, result in results:
+                output.write(json.dumps({"text": text, "label": result["label"], "score": result["score"]}) + "\n")
+    stats = {**service.stats(), "sentences_per_second": len(results) / elapsed if elapsed else 0.0, "seconds": elapsed}
+    print(f"✅ {len(results)} texts in {elapsed:.2f} s: {stats['sentences_per_second']:.0f} sentences/s, p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms, avg batch {stats['avg_batch_size']:.1f}, padding waste {stats['padding_waste_ratio']:.1%}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify a local file of texts (one per line) through the batched OpenVINO classifier")
+    parser.add_argument("input", help="Text file with one input per line")
+    parser.add_argument("-m", "--model_path", default="models/model.xml", help="Exported OpenVINO classifier")
+    parser.add_argument("-t", "--tokenizer", default=MODEL, help="Tokenizer (and label config) id or path")
+    parser.add_argument("-d", "--device", default="CPU", help="Device for inference")
+    parser.add_argument("--max_batch_size", type=int, default=32, help="Texts per batch")
+    parser.add_argument("--max_wait_ms", type=float, default=5, help="How long a text may wait for its bucket to fill")
+    parser.add_argument("--rate", type=float, default=None, help="Replay the file at this many texts/s instead of as fast as possible")
+    parser.add_argument("-o", "--output", default=None, help="Optional JSONL file for predictions")
+    parser.add_argument("--static_shapes", nargs="*", type=parse_shape, default=None, help="Precompile these BATCHxSEQ_LEN shapes, e.g. 1x16 16x32 32x64 32x128")
+    args = parser.parse_args()
+
+    service = ClassifierService(args.model_path, args.tokenizer, args.device, args.max_batch_size, args.max_wait_ms, static_shapes=args.static_shapes)
+    stream_file(service, args.input, args.output, args.rate)
+    service.close()
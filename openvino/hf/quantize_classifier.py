@@ -0,0 +1,147 @@
+# /qompassai/intel/openvino/hf/quantize_classifier.py
+# Qompass AI Hugging Face Classifier INT8 Quantization
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import argparse
+import json
+import time
+from pathlib import Path
+
+from classifier_service import MODEL, ClassifierService
+
+
+def read_texts(path, with_labels=False):
+    # JSONL with "text" (and "label") fields, or plain lines of "text" / "text<TAB>label"
+    examples = []
+    with open(path) as lines:
+        for line in lines:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if Path(path).suffix == ".jsonl":
+                record = json.loads(line)
+                text, label = record["text"], record.get("label")
+            else:
+                text, _, label = line.partition("\t") if with_labels else (line, "", None)
+            examples.append((text, label) if with_labels else text)
+    return examples
+
+
+def label_ids(examples, id2label, source="held-out set"):
+    # gold labels as class ids, given either by name ("POSITIVE") or by index ("1"); checked before any work is done
+    # because an unknown label would otherwise only show up as a wrong prediction in the accuracy
+    label2id = {label: index for index, label in id2label.items()}
+    mapped, unknown = [], set()
+    for text, label in examples:
+        if isinstance(label, int) or str(label).isdigit():
+            index = int(label) if int(label) in id2label else None
+        else:
+            index = label2id.get(label)
+        if index is None:
+            unknown.add(str(label))
+        mapped.append((text, index))
+    if unknown:
+        raise ValueError(f"{source} has labels unknown to the model: {sorted(unknown)}; expected one of {sorted(label2id)} or their ids {sorted(id2label)}")
+    return mapped
+
+
+def quantize(model_path, tokenizer, calibration_texts, output_path, max_length=128):
+    import nncf
+    import openvino as ov
+
+    core = ov.Core()
+    model = core.read_model(str(model_path))
+    input_names = {name for port in model.inputs for name in port.get_names()}
+
+    def transform_fn(text):
+        encoded = tokenizer(text, truncation=True, max_length=max_length, return_tensors="np")
+        return {name: value for name, value in encoded.items() if name in input_names}
+
+    start = time.perf_counter()
+    quantized = nncf.quantize(
+        model,
+        nncf.Dataset(calibration_texts, transform_fn),
+        model_type=nncf.ModelType.TRANSFORMER,
+        subset_size=len(calibration_texts),
+    )
+    ov.save_model(quantized, str(output_path))
+    print(f"✅ INT8 model quantized on {len(calibration_texts)} calibration texts in {time.perf_counter() - start:.1f} s")
+    return output_path
+
+
+def evaluate(model_path, tokenizer_id, examples, device="CPU", max_batch_size=32):
+    # accuracy, throughput and latency of one model on the held-out set (gold labels already mapped by label_ids),
+    # through the same batched service used in production
+    service = ClassifierService(model_path, tokenizer_id, device, max_batch_size=max_batch_size)
+    label2id = {label: index for index, label in service.labels.items()}
+    service.classify([text for text, _ in examples[:max_batch_size]])
+    service.latencies.clear()
+    start = time.perf_counter()
+    results = service.classify([text for text, _ in examples])
+    elapsed = time.perf_counter() - start
+    stats = service.stats()
+    service.close()
+    correct = 0
+    for (_, gold), result in zip(examples, results):
+        correct += label2id.get(result["label"], result["label"]) == gold
+    return {
+        "accuracy": correct / len(examples),
+        "sentences_per_second": len(examples) / elapsed,
+        "p50_ms": stats["p50_ms"],
+        "p99_ms": stats["p99_ms"],
+    }
+
+
+def quantize_with_gate(model_path, calibration_path, heldout_path, output_path=None, tokenizer_id=MODEL, device="CPU", max_accuracy_drop=0.01, max_length=128):
+    # The INT8 model is kept only if it loses at most ``max_accuracy_drop`` accuracy (absolute) against the FP16 one.
+    from transformers import AutoConfig, AutoTokenizer
+
+    model_path = Path(model_path)
+    output_path = Path(output_path or model_path.with_name(model_path.stem + "_int8.xml"))
+    candidate_path = output_path.with_name(output_path.stem + ".candidate.xml")
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
+    calibration_texts = read_texts(calibration_path)
+    heldout = [(text, label) for text, label in read_texts(heldout_path, with_labels=True) if label not in (None, "")]
+    if not heldout:
+        raise ValueError(f"{heldout_path} has no labelled examples")
+    heldout = label_ids(heldout, AutoConfig.from_pretrained(tokenizer_id).id2label, heldout_path)
+
+    quantize(model_path, tokenizer, calibration_texts, candidate_path, max_length)
+    print(f"⌛ Evaluating FP16 and INT8 on {len(heldout)} held-out texts")
+    fp16 = evaluate(model_path, tokenizer_id, heldout, device)
+    int8 = evaluate(candidate_path, tokenizer_id, heldout, device)
+    accuracy_drop = fp16["accuracy"] - int8["accuracy"]
+    accepted = accuracy_drop <= max_accuracy_drop
+    report = {
+        "fp16": fp16,
+        "int8": int8,
+        "accuracy_drop": accuracy_drop,
+        "max_accuracy_drop": max_accuracy_drop,
+        "speedup": int8["sentences_per_second"] / fp16["sentences_per_second"],
+        "accepted": accepted,
+    }
+    if accepted:
+        for suffix in (".xml", ".bin"):
+            candidate_path.with_suffix(suffix).replace(output_path.with_suffix(suffix))
+        print(f"✅ INT8 accepted: accuracy {int8['accuracy']:.4f} vs {fp16['accuracy']:.4f}, {report['speedup']:.2f}x throughput, saved to {output_path}")
+    else:
+        for suffix in (".xml", ".bin"):
+            candidate_path.with_suffix(suffix).unlink(missing_ok=True)
+        print(f"❌ INT8 rejected: accuracy drop {accuracy_drop:.4f} exceeds {max_accuracy_drop:.4f}; keeping FP16 only")
+    output_path.with_suffix(".report.json").write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NNCF INT8 post-training quantization of the exported classifier with an accuracy gate")
+    parser.add_argument("calibration", help="Calibration texts: .jsonl with a text field or one text per line")
+    parser.add_argument("heldout", help="Labelled held-out set: .jsonl with text and label fields or text<TAB>label lines")
+    parser.add_argument("-m", "--model_path", default="models/model.xml", help="FP16 OpenVINO classifier")
+    parser.add_argument("-o", "--output_path", default=None, help="Where to keep the INT8 model (default: <model>_int8.xml)")
+    parser.add_argument("-t", "--tokenizer", default=MODEL, help="Tokenizer (and label config) id or path")
+    parser.add_argument("-d", "--device", default="CPU", help="Device for inference")
+    parser.add_argument("--max_accuracy_drop", type=float, default=0.01, help="Largest absolute accuracy loss accepted for INT8")
+    parser.add_argument("--max_length", type=int, default=128, help="Token limit for calibration texts")
+    args = parser.parse_args()
+
+    quantize_with_gate(args.model_path, args.calibration, args.heldout, args.output_path, args.tokenizer, args.device, args.max_accuracy_drop, args.max_length)
@@ -0,0 +1,179 @@
+# /qompassai/intel/openvino/imagegen/flex2_batch.py
+# Qompass AI Image Gen Flex2 Batch Runner
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import torch
+from PIL import Image
+
+JOB_DEFAULTS = {
+    "seed": 42,
+    "width": 1024,
+    "height": 1024,
+    "guidance_scale": 3.5,
+    "control_strength": 0.5,
+    "control_stop": 0.33,
+    "num_inference_steps": 20,
+}
+
+
+def read_manifest(manifest_path, skip_ids=()):
+    with open(manifest_path) as manifest:
+        for line_number, line in enumerate(manifest, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            job = {**JOB_DEFAULTS, **json.loads(line)}
+            job.setdefault("id", f"job-{line_number:06d}")
+            if job["id"] not in skip_ids:
+                yield job
+
+
+def read_checkpoint(checkpoint_path):
+    if not checkpoint_path.exists():
+        return set()
+    done = set()
+    with checkpoint_path.open() as checkpoint:
+        for line in checkpoint:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                # a torn last line from an interrupted run: that job simply runs again
+                continue
+    return done
+
+
+def load_inputs(job, base_dir):
+    def load(key, mode):
+        if not job.get(key):
+            return None
+        image = Image.open(base_dir / job[key])
+        image.load()
+        return image.convert(mode)
+
+    return {"inpaint_image": load("image", "RGB"), "inpaint_mask": load("mask", "L"), "control_image": load("control_image", "RGB")}
+
+
+class BackgroundWriter:
+    """Saves finished images and records them in the checkpoint on its own thread."""
+
+    def __init__(self, output_dir, checkpoint_path, max_pending=16):
+        self.output_dir = output_dir
+        self.checkpoint_path = checkpoint_path
+        self.errors = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="flex2-batch-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, job, image, seconds):
+        self._queue.put((job, image, seconds))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        with self.checkpoint_path.open("a") as checkpoint:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                job, image, seconds = item
+                try:
+                    output = self.output_dir / job.get("output", f"{job['id']}.png")
+                    partial = output.with_name(f".{output.name}.partial")
+                    image.save(partial, format=Image.registered_extensions().get(output.suffix.lower(), "PNG"))
+                    os.replace(partial, output)
+                    # the job only counts as done once its image is safely on disk
+                    checkpoint.write(json.dumps({"id": job["id"], "output": str(output), "seconds": round(seconds, 3)}) + "\n")
+                    checkpoint.flush()
+                    os.fsync(checkpoint.fileno())
+                except Exception as exc:
+                    self.errors.append((job["id"], repr(exc)))
+
+
+def run_batch(pipe, manifest_path, output_dir, prefetch=4, io_workers=4, pipe_kwargs=None):
+    manifest_path, output_dir = Path(manifest_path), Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = output_dir / "completed.jsonl"
+    done = read_checkpoint(checkpoint_path)
+    if done:
+        print(f"⏭ Resuming: {len(done)} jobs already completed")
+    jobs = read_manifest(manifest_path, done)
+    writer = BackgroundWriter(output_dir, checkpoint_path)
+    failed = []
+    completed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="flex2-batch-reader") as readers:
+        # keep ``prefetch`` jobs decoding while the model works on the current one
+        pending = deque()
+
+        def refill():
+            while len(pending) < prefetch:
+                job = next(jobs, None)
+                if job is None:
+                    return
+                pending.append((job, readers.submit(load_inputs, job, manifest_path.parent)))
+
+        refill()
+        while pending:
+            job, inputs = pending.popleft()
+            refill()
+            try:
+                inputs = {key: value for key, value in inputs.result().items() if value is not None}
+                job_start = time.perf_counter()
+                image = pipe(
+                    prompt=job["prompt"],
+                    height=job["height"],
+                    width=job["width"],
+                    guidance_scale=job["guidance_scale"],
+                    control_strength=job["control_strength"],
+                    control_stop=job["control_stop"],
+                    num_inference_steps=job["num_inference_steps"],
+                    generator=torch.Generator("cpu").manual_seed(int(job["seed"])),
+                    **inputs,
+                    **(pipe_kwargs or {}),
+                ).images[0]
+            except Exception as exc:
+                failed.append((job["id"], repr(exc)))
+                print(f"❌ {job['id']}: {exc!r}")
+                continue
+            writer.put(job, image, time.perf_counter() - job_start)
+            completed += 1
+    writer.close()
+    failed.extend(writer.errors)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {completed} jobs in {elapsed:.1f} s ({60 * completed / elapsed if elapsed else 0:.1f} images/min), {len(failed)} failed")
+    return {"completed": completed, "failed": failed, "seconds": elapsed}
+
+
+if __name__ == "__main__":
+    from ov_flex2_helper import OVFlex2Pipeline
+
+    parser = argparse.ArgumentParser(description="Headless Flex.2 inpainting over a JSONL job manifest")
+    parser.add_argument("manifest", help="JSONL file with one job per line (id, prompt, image, mask, control_image and pipeline parameters)")
+    parser.add_argument("-m", "--model_dir", required=True, help="Converted model directory")
+    parser.add_argument("-d", "--device", default="CPU", help="Device for inference")
+    parser.add_argument("-o", "--output_dir", default="flex2_outputs", help="Directory for images and the completed.jsonl checkpoint")
+    parser.add_argument("--prefetch", type=int, default=4, help="Jobs decoded ahead of the model")
+    parser.add_argument("--io_workers", type=int, default=4, help="Threads decoding input images")
+    parser.add_argument("--ov_cache_dir", default=None, help="OpenVINO compiled-model cache directory")
+    parser.add_argument("--prompt_cache_mb", type=int, default=256, help="Prompt-embedding cache size (0 disables)")
+    parser.add_argument("--latent_cache_mb", type=int, default=512, help="Image latent cache size (0 disables)")
+    args = parser.parse_args()
+
+    pipe = OVFlex2Pipeline.from_pretrained(args.model_dir, device=args.device, ov_cache_dir=args.ov_cache_dir)
+    if args.prompt_cache_mb:
+        pipe.enable_prompt_cache(max_bytes=args.prompt_cache_mb * 1024**2)
+    if args.latent_cache_mb:
+        pipe.enable_latent_cache(max_bytes=args.latent_cache_mb * 1024**2)
+    run_batch(pipe, args.manifest, args.output_dir, prefetch=args.prefetch, io_workers=args.io_workers)
@@ -0,0 +1,180 @@
+# /qompassai/intel/openvino/imagegen/flex2_benchmark.py
+# Qompass AI Image Gen Flex2 Benchmark
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import argparse
+import csv
+import json
+import platform
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from importlib import metadata
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+from flex2_memory import PeakRSSMonitor
+from ov_flex2_helper import SUBMODEL_NAMES, OVFlex2Pipeline, patched
+
+PERCENTILES = (50, 90, 99)
+
+
+class ComponentTimer:
+    """Records the wall time of every forward of every submodel while active."""
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.samples = defaultdict(list)
+
+    def activate(self, stack):
+        for name in SUBMODEL_NAMES:
+            part = getattr(self.pipe, name, None)
+            if part is not None:
+                stack.enter_context(patched(part, "forward", self._timed(name, part.forward)))
+
+    def _timed(self, name, forward):
+        def timed_forward(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return forward(*args, **kwargs)
+            finally:
+                self.samples[name].append(time.perf_counter() - start)
+
+        return timed_forward
+
+
+def summarize(samples):
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    summary = {"count": int(values.size), "mean_ms": float(values.mean())}
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}_ms"] = float(np.percentile(values, percentile))
+    return summary
+
+
+def make_inputs(width, height, batch_size, seed=0):
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None].repeat(height, axis=0).repeat(3, axis=2)
+    pixels = np.clip(gradient + rng.normal(0, 24, gradient.shape), 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels)
+    mask = Image.new("L", (width, height), 0)
+    mask.paste(255, (width // 4, height // 4, 3 * width // 4, 3 * height // 4))
+    return [image] * batch_size, [mask] * batch_size
+
+
+def environment():
+    versions = {}
+    for package in ("openvino", "optimum-intel", "optimum", "diffusers", "transformers", "torch"):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(), "packages": versions}
+
+
+def benchmark_config(pipe, width, height, steps, batch_size, repeats, warmup, prompt):
+    images, masks = make_inputs(width, height, batch_size)
+    kwargs = dict(
+        prompt=[prompt] * batch_size,
+        inpaint_image=images,
+        inpaint_mask=masks,
+        width=width,
+        height=height,
+        num_inference_steps=steps,
+    )
+    for i in range(warmup):
+        pipe(generator=[torch.Generator("cpu").manual_seed(i + j) for j in range(batch_size)], **kwargs)
+
+    timer = ComponentTimer(pipe)
+    latencies = []
+    with PeakRSSMonitor() as memory, ExitStack() as stack:
+        timer.activate(stack)
+        for i in range(repeats):
+            start = time.perf_counter()
+            pipe(generator=[torch.Generator("cpu").manual_seed(i + j) for j in range(batch_size)], **kwargs)
+            latencies.append(time.perf_counter() - start)
+
+    total = float(np.sum(latencies))
+    return {
+        "width": width,
+        "height": height,
+        "num_inference_steps": steps,
+        "batch_size": batch_size,
+        "repeats": repeats,
+        "end_to_end": summarize(latencies),
+        "images_per_second": batch_size * repeats / total if total else 0.0,
+        "components": {name: summarize(samples) for name, samples in timer.samples.items()},
+        **memory.as_dict(),
+    }
+
+
+def run_benchmark(model_dirs, device="CPU", resolutions=((512, 512),), steps=(20,), batch_sizes=(1,), repeats=3, warmup=1, ov_cache_dir=None, prompt="A white friendly robotic dog sitting on a bench"):
+    report = {"environment": environment(), "device": device, "models": []}
+    for model_dir in model_dirs:
+        model_dir = Path(model_dir)
+        with PeakRSSMonitor() as load_memory:
+            pipe = OVFlex2Pipeline.from_pretrained(model_dir, device=device, ov_cache_dir=ov_cache_dir)
+        model_report = {"model_dir": str(model_dir), "variant": model_dir.name, "load_timings": dict(pipe.load_timings), **load_memory.as_dict("load_"), "results": []}
+        for width, height in resolutions:
+            for num_steps in steps:
+                for batch_size in batch_sizes:
+                    print(f"⌛ {model_dir.name}: {width}x{height}, {num_steps} steps, batch {batch_size}")
+                    model_report["results"].append(benchmark_config(pipe, width, height, num_steps, batch_size, repeats, warmup, prompt))
+        report["models"].append(model_report)
+        del pipe
+    return report
+
+
+def report_rows(report):
+    for model in report["models"]:
+        for result in model["results"]:
+            base = {
+                "variant": model["variant"],
+                "model_dir": model["model_dir"],
+                "width": result["width"],
+                "height": result["height"],
+                "num_inference_steps": result["num_inference_steps"],
+                "batch_size": result["batch_size"],
+                "images_per_second": result["images_per_second"],
+                "peak_rss_mb": result["peak_rss_mb"],
+            }
+            for component, summary in [("end_to_end", result["end_to_end"]), *result["components"].items()]:
+                yield {**base, "component": component, **summary}
+
+
+def write_report(report, output):
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if output.suffix == ".csv":
+        rows = list(report_rows(report))
+        with output.open("w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        output.write_text(json.dumps(report, indent=2))
+    print(f"✅ Benchmark report written to {output}")
+
+
+def parse_resolution(value):
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height or width)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-component latency benchmark for OVFlex2Pipeline")
+    parser.add_argument("-m", "--model_dir", nargs="+", required=True, help="Converted model directories, e.g. Flex.2-preview/FP16 Flex.2-preview/INT8")
+    parser.add_argument("-d", "--device", default="CPU", help="Device for inference")
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution, default=[(512, 512)], help="WIDTHxHEIGHT values to sweep")
+    parser.add_argument("--steps", nargs="+", type=int, default=[20], help="num_inference_steps values to sweep")
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1], help="Batch sizes to sweep")
+    parser.add_argument("--repeats", type=int, default=3, help="Measured runs per configuration")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs per configuration")
+    parser.add_argument("--ov_cache_dir", default=None, help="OpenVINO compiled-model cache directory")
+    parser.add_argument("-o", "--output", default="flex2_benchmark.json", help="Report path (.json or .csv)")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.model_dir, args.device, args.resolutions, args.steps, args.batch_sizes, args.repeats, args.warmup, args.ov_cache_dir)
+    write_report(report, args.output)
@@ -0,0 +1,97 @@
+# /qompassai/intel/openvino/imagegen/flex2_cache.py
+# Qompass AI Image Gen Flex2 Caches
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_hash(*values):
+    # hashes PIL images, numpy arrays and torch tensors (or lists of them) by shape, dtype and pixels
+    digest = hashlib.blake2b(digest_size=20)
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            digest.update(b"[%d]" % len(value))
+            digest.update(content_hash(*value).encode())
+            continue
+        if hasattr(value, "detach"):
+            value = value.detach().cpu().numpy()
+        array = np.ascontiguousarray(np.asarray(value))
+        digest.update(f"{array.shape}{array.dtype}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    return 0
+
+
+class ByteLRUCache:
+    """Thread-safe LRU cache of numpy arrays (or tuples/dicts of them) bounded by total array bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return False
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
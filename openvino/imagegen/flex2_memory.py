@@ -0,0 +1,87 @@
+# /qompassai/intel/openvino/imagegen/flex2_memory.py
+# Qompass AI Image Gen Flex2 Memory Helpers
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import os
+import threading
+import time
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+
+
+class PeakRSSMonitor:
+    """Samples the process RSS on a background thread and keeps the peak seen inside the ``with`` block."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self.end_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="rss-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.end_rss = current_rss()
+        self.peak_rss = max(self.peak_rss, self.end_rss)
+        return False
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def as_dict(self, prefix=""):
+        mib = 1024**2
+        return {
+            f"{prefix}start_rss_mb": self.start_rss / mib,
+            f"{prefix}peak_rss_mb": self.peak_rss / mib,
+            f"{prefix}end_rss_mb": self.end_rss / mib,
+        }
+
+
+class StageMemory:
+    """Peak RSS and wall time per named stage; entering a stage closes the previous one."""
+
+    def __init__(self, on_transition=None):
+        self.stages = {}
+        self.on_transition = on_transition
+        self._active = None
+
+    @property
+    def current(self):
+        return self._active[0] if self._active else None
+
+    def enter(self, name):
+        if self.current == name:
+            return
+        previous = self.current
+        self.exit()
+        if self.on_transition is not None:
+            self.on_transition(previous, name)
+        self._active = (name, PeakRSSMonitor().__enter__(), time.perf_counter())
+
+    def exit(self):
+        if self._active is None:
+            return
+        name, monitor, start = self._active
+        monitor.__exit__(None, None, None)
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "peak_rss_mb": 0.0})
+        stage["seconds"] += time.perf_counter() - start
+        stage["peak_rss_mb"] = max(stage["peak_rss_mb"], monitor.peak_rss / 1024**2)
+        self._active = None
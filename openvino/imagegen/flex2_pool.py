@@ -0,0 +1,134 @@
+# /qompassai/intel/openvino/imagegen/flex2_pool.py
+# Qompass AI Image Gen Flex2 Pipeline Pool
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import copy
+import glob
+import threading
+from contextlib import contextmanager
+
+from ov_flex2_helper import SUBMODEL_NAMES, OVFlex2Pipeline
+
+
+def numa_node_count():
+    return max(1, len(glob.glob("/sys/devices/system/node/node[0-9]*")))
+
+
+class InferRequestHandle:
+    """Stands in for a submodel's compiled model, but runs every call on a dedicated infer request."""
+
+    def __init__(self, request):
+        self.compiled_model = request if hasattr(request, "create_infer_request") else request.get_compiled_model()
+        self.infer_request = self.compiled_model.create_infer_request()
+
+    def __call__(self, inputs=None, share_inputs=False, share_outputs=False, **kwargs):
+        return self.infer_request.infer(inputs, share_inputs=share_inputs, share_outputs=share_outputs)
+
+    def infer(self, inputs=None, share_inputs=False, share_outputs=False, **kwargs):
+        return self.infer_request.infer(inputs, share_inputs=share_inputs, share_outputs=share_outputs)
+
+    def __getattr__(self, name):
+        return getattr(self.compiled_model, name)
+
+
+def _copy_without(obj, *names):
+    clone = copy.copy(obj)
+    for name in names:
+        vars(clone).pop(name, None)
+    return clone
+
+
+def clone_pipeline(pipe):
+    # A shallow copy that shares every compiled model (and so every weight) with ``pipe`` but owns its
+    # infer requests, scheduler state and submodel wrappers, so both can denoise at the same time.
+    pipe.compile_submodels()
+    clone = copy.copy(pipe)
+    for name in SUBMODEL_NAMES:
+        part = getattr(pipe, name, None)
+        if part is None:
+            continue
+        part_clone = _copy_without(part, "forward")
+        part_clone.request = InferRequestHandle(part.request)
+        # bypass DiffusionPipeline.__setattr__, which would re-register the module in the shared config
+        vars(clone)[name] = part_clone
+    vae = _copy_without(pipe.vae, "encode", "decode")
+    vae.encoder, vae.decoder = vars(clone).get("vae_encoder"), vars(clone).get("vae_decoder")
+    vars(clone)["vae"] = vae
+    vars(clone)["scheduler"] = copy.deepcopy(pipe.scheduler)
+    if getattr(pipe, "mask_processor", None) is not None:
+        vars(clone)["mask_processor"] = _copy_without(pipe.mask_processor, "preprocess")
+    if getattr(pipe, "_latent_cache_hooked", False):
+        clone._hook_latent_cache()
+    if pipe.vae_tiling is not None:
+        clone.enable_vae_tiling(**pipe.vae_tiling)
+    return clone
+
+
+class Flex2PipelinePool:
+    """Several OVFlex2Pipeline instances over one set of compiled weights; calls go to the least-loaded instance."""
+
+    def __init__(self, pipe, num_instances=None):
+        num_instances = num_instances or numa_node_count()
+        self.instances = [pipe] + [clone_pipeline(pipe) for _ in range(num_instances - 1)]
+        self._in_flight = [0] * num_instances
+        self._completed = [0] * num_instances
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_pretrained(cls, model_id, num_instances=None, threads_per_instance=None, device="CPU", ov_config=None, **kwargs):
+        # One compiled model per submodel with a stream per instance: the CPU plugin places streams on
+        # NUMA nodes and pins their threads, and all streams of a node read the same weights.
+        num_instances = num_instances or numa_node_count()
+        config = {"PERFORMANCE_HINT": "THROUGHPUT", "NUM_STREAMS": str(num_instances), "ENABLE_CPU_PINNING": "YES"}
+        if threads_per_instance:
+            config["INFERENCE_NUM_THREADS"] = str(num_instances * threads_per_instance)
+        config.update(ov_config or {})
+        pipe = OVFlex2Pipeline.from_pretrained(model_id, device=device, ov_config=config, **kwargs)
+        return cls(pipe, num_instances)
+
+    @property
+    def size(self):
+        return len(self.instances)
+
+    @contextmanager
+    def acquire(self):
+        # an instance runs one call at a time: it owns one set of infer requests and one scheduler
+        with self._cond:
+            self._cond.wait_for(lambda: 0 in self._in_flight)
+            index = min((i for i in range(self.size) if self._in_flight[i] == 0), key=lambda i: self._completed[i])
+            self._in_flight[index] += 1
+        try:
+            yield self.instances[index]
+        finally:
+            with self._cond:
+                self._in_flight[index] -= 1
+                self._completed[index] += 1
+                self._cond.notify_all()
+
+    def __call__(self, *args, **kwargs):
+        with self.acquire() as pipe:
+            return pipe(*args, **kwargs)
+
+    def enable_prompt_cache(self, max_bytes=256 * 1024**2):
+        cache = self.instances[0].enable_prompt_cache(max_bytes)
+        for pipe in self.instances[1:]:
+            pipe.enable_prompt_cache(cache=cache)
+        return cache
+
+    def enable_latent_cache(self, max_bytes=512 * 1024**2):
+        cache = self.instances[0].enable_latent_cache(max_bytes)
+        for pipe in self.instances[1:]:
+            pipe.enable_latent_cache(cache=cache)
+        return cache
+
+    def enable_vae_tiling(self, min_pixels=1024 * 1024, tile_size=512, overlap=64):
+        for pipe in self.instances:
+            pipe.enable_vae_tiling(min_pixels=min_pixels, tile_size=tile_size, overlap=overlap)
+
+    def disable_vae_tiling(self):
+        for pipe in self.instances:
+            pipe.disable_vae_tiling()
+
+    def stats(self):
+        with self._cond:
+            return {"instances": self.size, "in_flight": list(self._in_flight), "completed": list(self._completed)}
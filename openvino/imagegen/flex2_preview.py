@@ -0,0 +1,57 @@
+# /qompassai/intel/openvino/imagegen/flex2_preview.py
+# Qompass AI Image Gen Flex2 Latent Previews
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import math
+
+import numpy as np
+from PIL import Image
+
+# Linear projection of the 16 Flux VAE latent channels to RGB (same factors ComfyUI uses for Flux previews).
+# Good enough to show composition and colour while denoising, at the cost of a matmul instead of a VAE decode.
+FLUX_LATENT_RGB_FACTORS = np.array(
+    [
+        [-0.0346, 0.0244, 0.0681],
+        [0.0034, 0.0210, 0.0687],
+        [0.0275, -0.0668, -0.0433],
+        [-0.0174, 0.0160, 0.0617],
+        [0.0859, 0.0721, 0.0329],
+        [0.0004, 0.0383, 0.0115],
+        [0.0405, 0.0861, 0.0915],
+        [-0.0236, -0.0185, -0.0259],
+        [-0.0245, 0.0250, 0.1180],
+        [0.1008, 0.0755, -0.0421],
+        [-0.0515, 0.0201, 0.0011],
+        [0.0428, -0.0012, -0.0036],
+        [0.0817, 0.0765, 0.0749],
+        [-0.1264, -0.0522, -0.1103],
+        [-0.0280, -0.0881, -0.0499],
+        [-0.1262, -0.0982, -0.0778],
+    ],
+    dtype=np.float32,
+)
+FLUX_LATENT_RGB_BIAS = np.array([-0.0329, -0.0718, -0.0851], dtype=np.float32)
+
+
+def unpack_latents(latents, height=None, width=None, vae_scale_factor=8):
+    # inverse of FluxPipeline._pack_latents: (B, H/2 * W/2, C * 4) -> (B, C, H, W) in latent pixels
+    latents = np.asarray(latents, dtype=np.float32)
+    batch_size, num_patches, packed_channels = latents.shape
+    if height and width:
+        latent_height = 2 * (int(height) // (vae_scale_factor * 2))
+        latent_width = 2 * (int(width) // (vae_scale_factor * 2))
+    else:
+        latent_height = latent_width = 2 * math.isqrt(num_patches)
+    channels = packed_channels // 4
+    latents = latents.reshape(batch_size, latent_height // 2, latent_width // 2, channels, 2, 2)
+    return latents.transpose(0, 3, 1, 4, 2, 5).reshape(batch_size, channels, latent_height, latent_width)
+
+
+def latents_to_previews(latents, height=None, width=None, vae_scale_factor=8):
+    if hasattr(latents, "detach"):
+        latents = latents.detach().float().cpu().numpy()
+    latents = unpack_latents(latents, height, width, vae_scale_factor)
+    rgb = np.einsum("bchw,cr->bhwr", latents, FLUX_LATENT_RGB_FACTORS) + FLUX_LATENT_RGB_BIAS
+    rgb = ((rgb.clip(-1, 1) + 1) * 127.5).astype(np.uint8)
+    size = (int(width), int(height)) if height and width else (rgb.shape[2] * vae_scale_factor, rgb.shape[1] * vae_scale_factor)
+    return [Image.fromarray(image).resize(size, Image.BILINEAR) for image in rgb]
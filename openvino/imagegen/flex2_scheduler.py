@@ -0,0 +1,187 @@
+# /qompassai/intel/openvino/imagegen/flex2_scheduler.py
+# Qompass AI Image Gen Flex2 Micro-batching Scheduler
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import numpy as np
+import torch
+
+
+@dataclass
+class Flex2Request:
+    prompt: str
+    inpaint_image: Any
+    inpaint_mask: Any
+    seed: int
+    height: int
+    width: int
+    num_inference_steps: int
+    guidance_scale: float = 3.5
+    control_image: Optional[Any] = None
+    control_strength: float = 0.5
+    control_stop: float = 0.33
+    preview_every: int = 0
+    step_cache_threshold: float = 0.0
+    step_cache_stats: Optional[dict] = None
+    future: Future = field(default_factory=Future)
+    previews: queue.Queue = field(default_factory=queue.Queue)
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def cancel(self):
+        # a queued request is dropped; a running one stops its batch once every request in it is cancelled
+        self.cancelled.set()
+        self.future.cancel()
+
+    def done(self):
+        return self.future.done()
+
+    def add_preview(self, step, image):
+        if self.preview_every > 0 and step % self.preview_every == 0:
+            self.previews.put((step, image))
+
+    @property
+    def shape_key(self):
+        return (self.height, self.width, self.num_inference_steps)
+
+    @property
+    def call_key(self):
+        # settings Flex2Pipeline only takes as scalars for the whole call
+        return (self.control_image is not None, self.control_strength, self.control_stop, self.step_cache_threshold)
+
+
+class Flex2RequestScheduler:
+    """Groups waiting requests by (height, width, num_inference_steps) and runs each group as one batched pipeline call."""
+
+    def __init__(self, pipe, max_batch_size=4, max_wait_ms=100, stats_window=512, num_workers=None):
+        self.pipe = pipe
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000
+        self._queues = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._latencies = deque(maxlen=stats_window)
+        self._batch_sizes = deque(maxlen=stats_window)
+        self._started_at = time.monotonic()
+        self._completed = 0
+        # one worker per pipeline instance when ``pipe`` is a Flex2PipelinePool
+        num_workers = num_workers or getattr(pipe, "size", 1)
+        self._workers = [threading.Thread(target=self._run, name=f"flex2-scheduler-{i}", daemon=True) for i in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, **kwargs) -> Flex2Request:
+        request = Flex2Request(**kwargs)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Flex2RequestScheduler is closed")
+            self._queues.setdefault(request.shape_key, deque()).append(request)
+            self._cond.notify_all()
+        return request
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self):
+        with self._cond:
+            latencies = np.array(self._latencies, dtype=np.float64)
+            batch_sizes = np.array(self._batch_sizes, dtype=np.float64)
+            elapsed = time.monotonic() - self._started_at
+            return {
+                "completed": self._completed,
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "images_per_minute": 60 * self._completed / elapsed if elapsed > 0 else 0.0,
+                "mean_batch_size": float(batch_sizes.mean()) if batch_sizes.size else 0.0,
+                "p50_latency_s": float(np.percentile(latencies, 50)) if latencies.size else 0.0,
+                "p95_latency_s": float(np.percentile(latencies, 95)) if latencies.size else 0.0,
+            }
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                pending = [key for key, queue in self._queues.items() if queue]
+                if not pending:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                # serve the group whose head has waited longest, so a busy resolution cannot starve the others
+                key = min(pending, key=lambda k: self._queues[k][0].enqueued_at)
+                queue = self._queues[key]
+                deadline = queue[0].enqueued_at + self.max_wait
+                while queue and len(queue) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch_size))]
+                if batch:
+                    return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.call_key, []).append(request)
+            for group in groups.values():
+                self._run_group(group)
+
+    def _run_group(self, group):
+        try:
+            output = self._call_pipe(group)
+        except Exception as exc:
+            for request in group:
+                request.future.set_exception(exc)
+            return
+        finished_at = time.monotonic()
+        with self._cond:
+            self._completed += len(group)
+            self._batch_sizes.append(len(group))
+            self._latencies.extend(finished_at - request.enqueued_at for request in group)
+        for request, image in zip(group, output.images):
+            request.step_cache_stats = getattr(output, "step_cache_stats", None)
+            request.future.set_result(image)
+
+    def _call_pipe(self, group):
+        first = group[0]
+        kwargs = {}
+        if first.control_image is not None:
+            kwargs["control_image"] = [request.control_image for request in group]
+        preview_intervals = [request.preview_every for request in group if request.preview_every > 0]
+        if preview_intervals:
+            kwargs["preview_every"] = math.gcd(*preview_intervals)
+            kwargs["preview_callback"] = lambda step, images: [request.add_preview(step, image) for request, image in zip(group, images)]
+        return self.pipe(
+            prompt=[request.prompt for request in group],
+            inpaint_image=[request.inpaint_image for request in group],
+            inpaint_mask=[request.inpaint_mask for request in group],
+            height=first.height,
+            width=first.width,
+            num_inference_steps=first.num_inference_steps,
+            guidance_scale=[request.guidance_scale for request in group],
+            control_strength=first.control_strength,
+            control_stop=first.control_stop,
+            generator=[torch.Generator("cpu").manual_seed(int(request.seed)) for request in group],
+            should_stop=lambda: all(request.cancelled.is_set() for request in group),
+            step_cache_threshold=first.step_cache_threshold,
+            **kwargs,
+        )
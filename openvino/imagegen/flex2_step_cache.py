@@ -0,0 +1,49 @@
+# /qompassai/intel/openvino/imagegen/flex2_step_cache.py
+# Qompass AI Image Gen Flex2 Step Cache
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+class StepCache:
+    """TeaCache-style step skipping: reuse the previous transformer output while the input barely changes."""
+
+    def __init__(self, threshold, num_inference_steps, warmup_steps=2):
+        self.threshold = threshold
+        self.num_inference_steps = num_inference_steps
+        self.warmup_steps = warmup_steps
+        self.step = 0
+        self.computed = 0
+        self.skipped = 0
+        self._accumulated = 0.0
+        self._previous_input = None
+        self._previous_output = None
+
+    def stats(self):
+        return {"computed_steps": self.computed, "skipped_steps": self.skipped, "threshold": self.threshold}
+
+    def _should_compute(self, hidden_states):
+        if self._previous_input is None or self._previous_input.shape != hidden_states.shape:
+            return True
+        if self.step < self.warmup_steps or self.step >= self.num_inference_steps - 1:
+            return True
+        dims = tuple(range(1, hidden_states.dim()))
+        change = (hidden_states - self._previous_input).abs().mean(dim=dims) / self._previous_input.abs().mean(dim=dims).clamp_min(1e-6)
+        self._accumulated += float(change.max())
+        return self._accumulated >= self.threshold
+
+    # The compiled transformer is a black box, so the packed model input (noisy latents plus inpaint and
+    # control conditioning) stands in for the timestep-modulated input, and its last output for the residual.
+    def wrap(self, forward):
+        def cached_forward(*args, hidden_states=None, **kwargs):
+            compute = self._should_compute(hidden_states)
+            self._previous_input = hidden_states.detach().clone()
+            self.step += 1
+            if not compute:
+                self.skipped += 1
+                output = self._previous_output
+            else:
+                self._accumulated = 0.0
+                self.computed += 1
+                output = forward(*args, hidden_states=hidden_states, **kwargs)
+                self._previous_output = output
+            return output
+
+        return cached_forward
@@ -0,0 +1,74 @@
+# /qompassai/intel/openvino/imagegen/flex2_tiled_vae.py
+# Qompass AI Image Gen Flex2 Tiled VAE
+# Copyright (C) 2025 Qompass AI, All rights reserved
+####################################################
+import torch
+from diffusers.models.autoencoders.vae import DiagonalGaussianDistribution
+from transformers.modeling_outputs import ModelOutput
+
+
+def tile_starts(size, tile, overlap):
+    if size <= tile:
+        return [0]
+    stride = tile - overlap
+    starts = list(range(0, size - tile, stride))
+    return starts + [size - tile]
+
+
+def blend_ramp(length, overlap, first, last):
+    ramp = torch.ones(length)
+    if overlap > 0:
+        fade = torch.linspace(0, 1, overlap + 2)[1:-1]
+        if not first:
+            ramp[:overlap] = fade
+        if not last:
+            ramp[-overlap:] = fade.flip(0)
+    return ramp
+
+
+def _fields(output):
+    return {name: (value.parameters if isinstance(value, DiagonalGaussianDistribution) else value, isinstance(value, DiagonalGaussianDistribution)) for name, value in output.items()}
+
+
+def tiled_forward(forward, sample, tile, overlap, scale, *args, **kwargs):
+    # Runs ``forward`` tile by tile over the spatial dims of ``sample`` and linearly blends the overlaps, so the
+    # submodel only ever sees ``tile``-sized inputs. ``scale`` is output pixels per input pixel (8 for the
+    # decoder, 1/8 for the encoder). Only the blended output buffers grow with the image.
+    height, width = sample.shape[-2:]
+    out_height, out_width, out_overlap = int(height * scale), int(width * scale), int(overlap * scale)
+    row_starts, col_starts = tile_starts(height, tile, overlap), tile_starts(width, tile, overlap)
+    weights = torch.zeros(out_height, out_width)
+    accumulated, is_dist = {}, {}
+    for i, top in enumerate(row_starts):
+        for j, left in enumerate(col_starts):
+            fields = _fields(forward(sample[..., top : top + tile, left : left + tile], *args, **kwargs))
+            out_top, out_left = int(top * scale), int(left * scale)
+            ramp = None
+            for name, (value, dist) in fields.items():
+                out_h, out_w = value.shape[-2:]
+                if ramp is None:
+                    # every field shares the output grid, so one weight map serves them all
+                    ramp_h = blend_ramp(out_h, out_overlap, i == 0, i == len(row_starts) - 1)
+                    ramp_w = blend_ramp(out_w, out_overlap, j == 0, j == len(col_starts) - 1)
+                    ramp = ramp_h[:, None] * ramp_w[None, :]
+                    weights[out_top : out_top + out_h, out_left : out_left + out_w] += ramp
+                if name not in accumulated:
+                    accumulated[name] = torch.zeros(*value.shape[:-2], out_height, out_width, dtype=torch.float32)
+                    is_dist[name] = dist
+                accumulated[name][..., out_top : out_top + out_h, out_left : out_left + out_w] += value.float() * ramp
+    blended = {}
+    for name, value in accumulated.items():
+        value = value / weights.clamp_min(1e-6)
+        blended[name] = DiagonalGaussianDistribution(value) if is_dist[name] else value
+    return ModelOutput(**blended)
+
+
+def tile_forward(forward, min_pixels, tile, overlap, scale, pixel_scale):
+    # ``pixel_scale`` converts an input side to image pixels so ``min_pixels`` means the same for encoder and decoder
+    def forward_maybe_tiled(sample, *args, **kwargs):
+        height, width = sample.shape[-2:]
+        if height * width * pixel_scale**2 <= min_pixels or (height <= tile and width <= tile):
+            return forward(sample, *args, **kwargs)
+        return tiled_forward(forward, sample, tile, overlap, scale, *args, **kwargs)
+
+    return forward_maybe_tiled
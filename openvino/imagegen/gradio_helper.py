@@ -2,16 +2,29 @@
 # Qompass AI Image Gen Gradio Helper
 # Copyright (C) 2025 Qompass AI, All rights reserved
 ####################################################
+import queue
+
 import gradio as gr
 import numpy as np
-import torch
 from PIL import Image
 
+from flex2_scheduler import Flex2RequestScheduler
+from ov_flex2_helper import MaskCrop
+
 MAX_SEED = np.iinfo(np.int32).max
 MAX_IMAGE_SIZE = 2048
 
 
-def make_demo(pipe):
+def make_demo(pipe, max_batch_size=1, max_wait_ms=100, prompt_cache_mb=0, latent_cache_mb=0, crop_to_mask=False, crop_margin=64, preview_every=5, vae_tiling_min_pixels=MAX_IMAGE_SIZE * MAX_IMAGE_SIZE // 4):
+    if prompt_cache_mb > 0:
+        pipe.enable_prompt_cache(max_bytes=prompt_cache_mb * 1024**2)
+    if latent_cache_mb > 0:
+        pipe.enable_latent_cache(max_bytes=latent_cache_mb * 1024**2)
+    if vae_tiling_min_pixels:
+        pipe.enable_vae_tiling(min_pixels=vae_tiling_min_pixels)
+    # even without batching every job goes through the scheduler's worker, so infer can stream previews and cancel
+    scheduler = Flex2RequestScheduler(pipe, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
     def infer(
         edit_images,
         prompt,
@@ -23,13 +36,16 @@ def make_demo(pipe):
         control_strength=0.5,
         control_stop=0.33,
         num_inference_steps=50,
+        crop_to_mask=False,
+        crop_margin=64,
+        step_cache_threshold=0.0,
         progress=gr.Progress(track_tqdm=True),
     ):
         image = edit_images["background"].convert("RGB")
         mask = Image.fromarray(np.array(edit_images["layers"][-1])[:, :, -1])
         if randomize_seed:
             seed = np.random.randint(0, MAX_SEED)
-        out_image = pipe(
+        request = dict(
             prompt=prompt,
             inpaint_image=image,
             inpaint_mask=mask,
@@ -39,9 +55,31 @@ def make_demo(pipe):
             control_strength=control_strength,
             control_stop=control_stop,
             num_inference_steps=num_inference_steps,
-            generator=torch.Generator("cpu").manual_seed(seed),
-        ).images[0]
-        return (image, out_image), seed
+            step_cache_threshold=step_cache_threshold,
+        )
+        # cropping happens before scheduling so cropped jobs batch by their cropped size
+        crop = MaskCrop.from_mask(image, mask, int(width), int(height), margin=int(crop_margin)) if crop_to_mask else None
+        if crop is not None:
+            request.update(inpaint_image=crop.image, inpaint_mask=crop.mask, width=crop.width, height=crop.height)
+        job = scheduler.submit(seed=seed, preview_every=preview_every, **request)
+        try:
+            while not job.done():
+                try:
+                    _, preview = job.previews.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                yield (image, crop.paste(preview) if crop is not None else preview), seed
+            out_image = job.result()
+            if job.step_cache_stats:
+                skipped = job.step_cache_stats["skipped_steps"]
+                gr.Info(f"Step cache skipped {skipped} of {skipped + job.step_cache_stats['computed_steps']} transformer steps")
+        finally:
+            # Gradio closes the generator when the user cancels; stop denoising instead of finishing the job
+            if not job.done():
+                job.cancel()
+        if crop is not None:
+            out_image = crop.paste(out_image)
+        yield (image, out_image), seed
 
     css = """
 :root {
@@ -206,7 +244,9 @@ input[type="range"]::-webkit-slider-thumb {
                                 container=True,
                             )
 
-                            run_button = gr.Button("✨ Generate", elem_classes=["btn-primary"])
+                            with gr.Row():
+                                run_button = gr.Button("✨ Generate", elem_classes=["btn-primary"])
+                                stop_button = gr.Button("Stop")
                     # Right column: Output
                     with gr.Column(scale=1, elem_classes=["result-container"]):
                         result = gr.ImageSlider(label="Before & After", type="pil", image_mode="RGB", elem_classes=["result-animation"])
@@ -237,6 +277,13 @@ input[type="range"]::-webkit-slider-thumb {
                             control_stop = gr.Slider(0.0, 1.0, value=0.33, step=0.05, label="Control Stop")
                             num_inference_steps = gr.Slider(1, 100, value=20, step=1, label="Inference Steps")
 
+                        with gr.Row():
+                            crop_to_mask_checkbox = gr.Checkbox(label="Crop to mask", value=crop_to_mask)
+                            crop_margin_slider = gr.Slider(0, 512, value=crop_margin, step=16, label="Crop Context Margin")
+
+                        with gr.Row():
+                            step_cache_slider = gr.Slider(0.0, 1.0, value=0.0, step=0.01, label="Step Cache Threshold (0 = off)")
+
             # Footer
             gr.HTML(
                 """
@@ -246,10 +293,27 @@ input[type="range"]::-webkit-slider-thumb {
             """
             )
 
-        run_button.click(
+        run_event = run_button.click(
             fn=infer,
-            inputs=[edit_image, prompt, seed, randomize_seed, width, height, guidance_scale, control_strength, control_stop, num_inference_steps],
+            inputs=[
+                edit_image,
+                prompt,
+                seed,
+                randomize_seed,
+                width,
+                height,
+                guidance_scale,
+                control_strength,
+                control_stop,
+                num_inference_steps,
+                crop_to_mask_checkbox,
+                crop_margin_slider,
+                step_cache_slider,
+            ],
             outputs=[result, seed],
+            # let concurrent clicks reach the scheduler so they can share a batch (on every pool instance)
+            concurrency_limit=max_batch_size * getattr(pipe, "size", 1),
         )
+        stop_button.click(fn=None, cancels=[run_event])
 
     return demo
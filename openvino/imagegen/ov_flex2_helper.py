@@ -2,11 +2,494 @@
 # Qompass AI Image Gen OpenVino Flex2 Helper
 # Copyright (C) 2025 Qompass AI, All rights reserved
 ####################################################
+import gc
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image, ImageFilter
+from diffusers.models.autoencoders.vae import DiagonalGaussianDistribution
 from optimum.intel.openvino import OVDiffusionPipeline
 from pipeline import Flex2Pipeline
+from transformers.modeling_outputs import ModelOutput
+
+from flex2_cache import ByteLRUCache, content_hash
+from flex2_memory import StageMemory
+from flex2_preview import latents_to_previews
+from flex2_step_cache import StepCache
+from flex2_tiled_vae import tile_forward
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+@contextmanager
+def patched(obj, name, value):
+    # temporarily shadow an attribute (usually a submodel's ``forward``) on one instance
+    had_own = name in vars(obj)
+    original = vars(obj).get(name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        if had_own:
+            setattr(obj, name, original)
+        else:
+            delattr(obj, name)
+
+
+def _snap_span(start, end, limit, multiple, min_size):
+    size = max(end - start, min_size)
+    size = -(-size // multiple) * multiple
+    size = min(size, limit - limit % multiple or limit)
+    if size < end - start:
+        # the snapped size cannot hold the painted span plus margin: the caller falls back to the full canvas
+        return None
+    # grow symmetrically around the painted span, then shift back inside the canvas
+    start = min(max(0, start - (size - (end - start)) // 2), limit - size)
+    return start, start + size
+
+
+def mask_bounding_box(mask, margin=64, multiple=64, min_size=256):
+    painted = np.asarray(mask.convert("L")) > 0
+    if not painted.any():
+        return None
+    rows = np.flatnonzero(painted.any(axis=1))
+    cols = np.flatnonzero(painted.any(axis=0))
+    height, width = painted.shape
+    horizontal = _snap_span(max(0, cols[0] - margin), min(width, cols[-1] + 1 + margin), width, multiple, min_size)
+    vertical = _snap_span(max(0, rows[0] - margin), min(height, rows[-1] + 1 + margin), height, multiple, min_size)
+    if horizontal is None or vertical is None:
+        return 0, 0, width, height
+    return horizontal[0], vertical[0], horizontal[1], vertical[1]
+
+
+class MaskCrop:
+    """Crop of an inpainting job to the painted area of its mask, and the feathered paste back into the canvas."""
+
+    def __init__(self, canvas, mask, box, feather=16):
+        self.canvas = canvas
+        self.box = box
+        self.feather = feather
+        self.image = canvas.crop(box)
+        self.mask = mask.crop(box)
+
+    @classmethod
+    def from_mask(cls, image, mask, width, height, margin=64, feather=16, min_size=256, multiple=64):
+        # work at the resolution the pipeline would resize the job to anyway
+        canvas = image.convert("RGB").resize((width, height), Image.LANCZOS)
+        mask = mask.convert("L").resize((width, height), Image.LANCZOS)
+        box = mask_bounding_box(mask, margin=margin, multiple=multiple, min_size=min_size)
+        if box is None or box == (0, 0, width, height):
+            return None
+        return cls(canvas, mask, box, feather)
+
+    @property
+    def width(self):
+        return self.box[2] - self.box[0]
+
+    @property
+    def height(self):
+        return self.box[3] - self.box[1]
+
+    def crop(self, image):
+        return image.convert("RGB").resize(self.canvas.size, Image.LANCZOS).crop(self.box)
+
+    def paste(self, generated):
+        alpha = self.mask
+        if self.feather > 0:
+            alpha = alpha.point(lambda value: 255 if value > 0 else 0)
+            alpha = alpha.filter(ImageFilter.MaxFilter(2 * (self.feather // 2) + 1)).filter(ImageFilter.GaussianBlur(self.feather / 2))
+            alpha = np.asarray(alpha, dtype=np.float32)
+            # fade to the original along crop edges that lie inside the canvas so the seam is invisible
+            left, top, right, bottom = self.box
+            ramp_y = np.ones(self.height, dtype=np.float32)
+            ramp_x = np.ones(self.width, dtype=np.float32)
+            ramp = np.clip(np.arange(1, self.feather + 1, dtype=np.float32) / self.feather, 0, 1)
+            if top > 0:
+                ramp_y[: self.feather] = np.minimum(ramp_y[: self.feather], ramp)
+            if bottom < self.canvas.height:
+                ramp_y[-self.feather :] = np.minimum(ramp_y[-self.feather :], ramp[::-1])
+            if left > 0:
+                ramp_x[: self.feather] = np.minimum(ramp_x[: self.feather], ramp)
+            if right < self.canvas.width:
+                ramp_x[-self.feather :] = np.minimum(ramp_x[-self.feather :], ramp[::-1])
+            alpha = Image.fromarray((alpha * np.outer(ramp_y, ramp_x)).astype(np.uint8))
+        result = self.canvas.copy()
+        result.paste(generated.convert("RGB").resize((self.width, self.height), Image.LANCZOS), self.box[:2], alpha)
+        return result
+
+
+SUBMODEL_NAMES = ("text_encoder", "text_encoder_2", "transformer", "vae_encoder", "vae_decoder")
+STAGE_SUBMODELS = {
+    "text_encoding": ("text_encoder", "text_encoder_2"),
+    "vae_encoding": ("vae_encoder",),
+    "denoising": ("transformer",),
+    "vae_decoding": ("vae_decoder",),
+}
 
 
 class OVFlex2Pipeline(OVDiffusionPipeline, Flex2Pipeline):
     main_input_name = "prompt"
     export_feature = "text-to-image"
     auto_model_class = Flex2Pipeline
+    prompt_cache = None
+    latent_cache = None
+    step_cache = None
+    vae_tiling = None
+    sequential_residency = None
+    stage_memory = None
+
+    @classmethod
+    def from_pretrained(cls, model_id, *args, ov_cache_dir=None, warmup_resolutions=None, warmup_steps=1, memory_saver=False, release_transformer=False, **kwargs):
+        # ``ov_cache_dir`` is OpenVINO's CACHE_DIR: compiled blobs land there on the first start and are
+        # imported instead of recompiled on every later one (``cache_dir`` is already taken by the HF hub).
+        compile_now = kwargs.pop("compile", True)
+        ov_config = dict(kwargs.pop("ov_config", None) or {})
+        if ov_cache_dir is not None:
+            Path(ov_cache_dir).mkdir(parents=True, exist_ok=True)
+            ov_config["CACHE_DIR"] = str(ov_cache_dir)
+        start = time.perf_counter()
+        pipe = super().from_pretrained(model_id, *args, ov_config=ov_config, compile=False, **kwargs)
+        pipe.load_timings = {"read_models": time.perf_counter() - start}
+        if memory_saver:
+            pipe.enable_sequential_residency(release_transformer=release_transformer)
+        elif compile_now:
+            pipe.compile_submodels()
+        if warmup_resolutions:
+            pipe.warmup(warmup_resolutions, num_inference_steps=warmup_steps)
+        if (compile_now and not memory_saver) or warmup_resolutions:
+            pipe.print_load_timings()
+        return pipe
+
+    def compile_submodels(self):
+        timings = self.__dict__.setdefault("load_timings", {})
+        for name in SUBMODEL_NAMES:
+            submodel = getattr(self, name, None)
+            if submodel is None or getattr(submodel, "request", None) is not None:
+                continue
+            start = time.perf_counter()
+            submodel._compile()
+            timings[f"compile_{name}"] = time.perf_counter() - start
+
+    def warmup(self, resolutions, num_inference_steps=1):
+        # one throwaway job per resolution, so kernels for those shapes are built before the first user request
+        timings = self.__dict__.setdefault("load_timings", {})
+        for width, height in resolutions:
+            image = Image.new("RGB", (width, height), (127, 127, 127))
+            mask = Image.new("L", (width, height), 0)
+            mask.paste(255, (width // 4, height // 4, 3 * width // 4, 3 * height // 4))
+            start = time.perf_counter()
+            self(
+                prompt="warmup",
+                inpaint_image=image,
+                inpaint_mask=mask,
+                height=height,
+                width=width,
+                num_inference_steps=num_inference_steps,
+                generator=torch.Generator("cpu").manual_seed(0),
+            )
+            timings[f"warmup_{width}x{height}"] = time.perf_counter() - start
+
+    def print_load_timings(self):
+        timings = getattr(self, "load_timings", {})
+        for stage, seconds in timings.items():
+            print(f"⏱ {stage}: {seconds:.2f} s")
+        print(f"✅ Flex.2 pipeline ready in {sum(timings.values()):.2f} s")
+
+    def enable_sequential_residency(self, release_transformer=False):
+        # Memory-saver mode: a submodel is compiled only when its stage starts and released once the pipeline
+        # moves on, so text encoders (T5 alone is several GB) and the transformer are never resident together.
+        # By default the transformer stays compiled after a call and is only released when the next call has to run
+        # the text encoders (a prompt cache hit skips them and reuses it). With ``release_transformer`` it is dropped
+        # before VAE decode as well, trading a recompile (an import from ``ov_cache_dir`` when set) per call for the
+        # lowest peak. Uncompiled models stay memory-mapped IR.
+        self.sequential_residency = {"release_transformer": release_transformer}
+        self.release_submodels(*SUBMODEL_NAMES)
+
+    def disable_sequential_residency(self):
+        self.sequential_residency = None
+
+    def release_submodels(self, *names):
+        released = False
+        for name in names:
+            part = getattr(self, name, None)
+            if part is not None and getattr(part, "request", None) is not None:
+                part.request = None
+                if hasattr(part, "compiled_model"):
+                    part.compiled_model = None
+                released = True
+        if released:
+            gc.collect()
+
+    def _track_stages(self, stack):
+        keep = () if self.sequential_residency["release_transformer"] else ("transformer",)
+
+        def on_transition(previous, stage):
+            if previous is not None:
+                self.release_submodels(*(name for name in STAGE_SUBMODELS[previous] if name not in keep))
+            if stage == "text_encoding":
+                # a transformer kept from the previous call must not stay resident next to T5
+                self.release_submodels("transformer")
+
+        stages = StageMemory(on_transition)
+        for stage, names in STAGE_SUBMODELS.items():
+            for name in names:
+                part = getattr(self, name, None)
+                if part is not None:
+                    stack.enter_context(patched(part, "forward", self._staged_forward(stages, stage, part)))
+
+        def finish():
+            stages.exit()
+            self.release_submodels(*(name for name in SUBMODEL_NAMES if name not in keep))
+            self.stage_memory = stages.stages
+
+        stack.callback(finish)
+
+    @staticmethod
+    def _staged_forward(stages, stage, part):
+        forward = part.forward
+
+        def staged_forward(*args, **kwargs):
+            stages.enter(stage)
+            part._compile()
+            return forward(*args, **kwargs)
+
+        return staged_forward
+
+    def print_stage_memory(self):
+        for stage, stats in (self.stage_memory or {}).items():
+            print(f"📈 {stage}: peak RSS {stats['peak_rss_mb']:.0f} MB, {stats['seconds']:.2f} s")
+
+    def enable_prompt_cache(self, max_bytes=256 * 1024**2, cache=None):
+        self.prompt_cache = cache if cache is not None else ByteLRUCache(max_bytes)
+        return self.prompt_cache
+
+    def disable_prompt_cache(self):
+        self.prompt_cache = None
+
+    def enable_latent_cache(self, max_bytes=512 * 1024**2, cache=None):
+        self.latent_cache = cache if cache is not None else ByteLRUCache(max_bytes)
+        if not getattr(self, "_latent_cache_hooked", False):
+            self._hook_latent_cache()
+            self._latent_cache_hooked = True
+        return self.latent_cache
+
+    def disable_latent_cache(self):
+        self.latent_cache = None
+
+    def _hook_latent_cache(self):
+        # Inpaint and control images both reach the VAE encoder through ``vae.encode``, so caching
+        # there (keyed by the preprocessed pixels) covers both; the mask never touches the VAE and
+        # is cached at ``mask_processor.preprocess`` instead.
+        vae_encode = self.vae.encode
+
+        def encode(sample, *args, **kwargs):
+            if self.latent_cache is None:
+                return vae_encode(sample, *args, **kwargs)
+            # look up every image of a batch on its own so batched calls still hit per-image entries
+            keys = [("vae", content_hash(row)) for row in sample]
+            entries = [self.latent_cache.get(key) for key in keys]
+            missing = [i for i, entry in enumerate(entries) if entry is None]
+            if missing:
+                output = vae_encode(sample[missing], *args, **kwargs)
+                for row, i in enumerate(missing):
+                    entries[i] = {}
+                    for name, value in output.items():
+                        is_dist = isinstance(value, DiagonalGaussianDistribution)
+                        tensor = value.parameters if is_dist else value
+                        entries[i][name] = (is_dist, tensor[row].detach().cpu().numpy().astype(np.float16))
+                    self.latent_cache.put(keys[i], entries[i])
+            fields = {}
+            for name, (is_dist, _) in entries[0].items():
+                tensor = torch.from_numpy(np.stack([entry[name][1] for entry in entries])).float()
+                fields[name] = DiagonalGaussianDistribution(tensor) if is_dist else tensor
+            return ModelOutput(**fields)
+
+        self.vae.encode = encode
+
+        mask_processor = getattr(self, "mask_processor", None)
+        if mask_processor is None:
+            return
+        mask_preprocess = mask_processor.preprocess
+
+        def preprocess(image, height=None, width=None, **kwargs):
+            if self.latent_cache is None:
+                return mask_preprocess(image, height=height, width=width, **kwargs)
+            key = ("mask", content_hash(image), height, width, tuple(sorted(kwargs.items())))
+            array = self.latent_cache.get(key)
+            if array is None:
+                array = mask_preprocess(image, height=height, width=width, **kwargs).detach().cpu().numpy().astype(np.float16)
+                self.latent_cache.put(key, array)
+            return torch.from_numpy(array).float()
+
+        mask_processor.preprocess = preprocess
+
+    def enable_vae_tiling(self, min_pixels=1024 * 1024, tile_size=512, overlap=64):
+        # Above ``min_pixels`` the VAE encoder and decoder run on overlapping ``tile_size`` pixel tiles, so their
+        # activation memory stays at the tile size whatever the canvas. The hook sits on the submodels' forward,
+        # under the latent cache, which still sees (and caches) whole images.
+        self.disable_vae_tiling()
+        self.vae_tiling = {"min_pixels": min_pixels, "tile_size": tile_size, "overlap": overlap}
+        scale = self.vae_scale_factor
+        if getattr(self, "vae_encoder", None) is not None:
+            self.vae_encoder.forward = tile_forward(self.vae_encoder.forward, min_pixels, tile_size, overlap, 1 / scale, 1)
+        if getattr(self, "vae_decoder", None) is not None:
+            self.vae_decoder.forward = tile_forward(self.vae_decoder.forward, min_pixels, tile_size // scale, overlap // scale, scale, scale)
+
+    def disable_vae_tiling(self):
+        self.vae_tiling = None
+        for name in ("vae_encoder", "vae_decoder"):
+            part = getattr(self, name, None)
+            if part is not None:
+                vars(part).pop("forward", None)
+
+    def encode_prompt(
+        self,
+        prompt,
+        prompt_2=None,
+        device=None,
+        num_images_per_prompt=1,
+        prompt_embeds=None,
+        pooled_prompt_embeds=None,
+        max_sequence_length=512,
+        lora_scale=None,
+    ):
+        if self.prompt_cache is None or prompt is None or prompt_embeds is not None or pooled_prompt_embeds is not None:
+            return super().encode_prompt(
+                prompt=prompt,
+                prompt_2=prompt_2,
+                device=device,
+                num_images_per_prompt=num_images_per_prompt,
+                prompt_embeds=prompt_embeds,
+                pooled_prompt_embeds=pooled_prompt_embeds,
+                max_sequence_length=max_sequence_length,
+                lora_scale=lora_scale,
+            )
+
+        prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+        if prompt_2 is None:
+            prompts_2 = prompts
+        elif isinstance(prompt_2, str):
+            prompts_2 = [prompt_2] * len(prompts)
+        else:
+            prompts_2 = list(prompt_2)
+        embeds, pooled_embeds = [], []
+        for text, text_2 in zip(prompts, prompts_2):
+            key = (str(getattr(self, "model_save_dir", "")), text, text_2, max_sequence_length, lora_scale)
+            entry = self.prompt_cache.get(key)
+            if entry is None:
+                text_embeds, text_pooled_embeds, _ = super().encode_prompt(
+                    prompt=text,
+                    prompt_2=text_2,
+                    device=device,
+                    num_images_per_prompt=1,
+                    max_sequence_length=max_sequence_length,
+                    lora_scale=lora_scale,
+                )
+                entry = (text_embeds.detach().cpu().numpy(), text_pooled_embeds.detach().cpu().numpy())
+                self.prompt_cache.put(key, entry)
+            embeds.append(entry[0])
+            pooled_embeds.append(entry[1])
+
+        # same layout as FluxPipeline.encode_prompt: each prompt repeated num_images_per_prompt times in place
+        prompt_embeds = torch.from_numpy(np.concatenate(embeds)).repeat_interleave(num_images_per_prompt, dim=0)
+        pooled_prompt_embeds = torch.from_numpy(np.concatenate(pooled_embeds)).repeat_interleave(num_images_per_prompt, dim=0)
+        text_ids = torch.zeros(prompt_embeds.shape[1], 3, dtype=prompt_embeds.dtype)
+        return prompt_embeds, pooled_prompt_embeds, text_ids
+
+    def __call__(
+        self,
+        *args,
+        guidance_scale=3.5,
+        crop_to_mask=False,
+        crop_margin=64,
+        crop_feather=16,
+        preview_callback=None,
+        preview_every=5,
+        should_stop=None,
+        step_cache_threshold=0.0,
+        **kwargs,
+    ):
+        if crop_to_mask:
+            return self._call_cropped(
+                *args,
+                guidance_scale=guidance_scale,
+                crop_margin=crop_margin,
+                crop_feather=crop_feather,
+                preview_callback=preview_callback,
+                preview_every=preview_every,
+                should_stop=should_stop,
+                step_cache_threshold=step_cache_threshold,
+                **kwargs,
+            )
+        if preview_callback is not None or should_stop is not None:
+            kwargs["callback_on_step_end"] = self._step_callback(
+                kwargs.get("height"), kwargs.get("width"), preview_callback, preview_every, should_stop, kwargs.get("callback_on_step_end")
+            )
+            tensor_inputs = list(kwargs.get("callback_on_step_end_tensor_inputs") or [])
+            kwargs["callback_on_step_end_tensor_inputs"] = tensor_inputs if "latents" in tensor_inputs else tensor_inputs + ["latents"]
+        with ExitStack() as stack:
+            if self.sequential_residency is not None:
+                self._track_stages(stack)
+            self.step_cache = None
+            if step_cache_threshold > 0:
+                self.step_cache = StepCache(step_cache_threshold, kwargs.get("num_inference_steps") or 28)
+                stack.enter_context(patched(self.transformer, "forward", self.step_cache.wrap(self.transformer.forward)))
+            if isinstance(guidance_scale, (list, tuple)):
+                stack.enter_context(patched(self.transformer, "forward", self._per_sample_guidance_forward(guidance_scale, kwargs)))
+                guidance_scale = guidance_scale[0]
+            output = super().__call__(*args, guidance_scale=guidance_scale, **kwargs)
+        if self.step_cache is not None and hasattr(output, "images"):
+            output.step_cache_stats = self.step_cache.stats()
+        return output
+
+    def _per_sample_guidance_forward(self, guidance_scale, kwargs):
+        # Flex.2 embeds guidance per sample, so a batch can mix guidance values even though
+        # Flex2Pipeline only accepts a scalar: pass the first one through and swap in the
+        # per-sample vector on its way into the transformer.
+        num_images_per_prompt = kwargs.get("num_images_per_prompt") or 1
+        per_sample_guidance = torch.tensor(guidance_scale, dtype=torch.float32).repeat_interleave(num_images_per_prompt)
+        transformer_forward = self.transformer.forward
+
+        def forward(*f_args, guidance=None, **f_kwargs):
+            if guidance is not None:
+                guidance = per_sample_guidance.to(guidance.dtype)
+            return transformer_forward(*f_args, guidance=guidance, **f_kwargs)
+
+        return forward
+
+    def _step_callback(self, height, width, preview_callback, preview_every, should_stop, user_callback):
+        def callback(pipe, step, timestep, callback_kwargs):
+            # raising (rather than setting ``_interrupt``) also skips the VAE decode of a result nobody will see
+            if should_stop is not None and should_stop():
+                raise GenerationCancelled(f"generation cancelled after {step + 1} steps")
+            if preview_callback is not None and preview_every > 0 and (step + 1) % preview_every == 0 and step + 1 < pipe.num_timesteps:
+                preview_callback(step + 1, latents_to_previews(callback_kwargs["latents"], height, width, pipe.vae_scale_factor))
+            if user_callback is not None:
+                callback_kwargs = user_callback(pipe, step, timestep, callback_kwargs)
+            return callback_kwargs
+
+        return callback
+
+    def _call_cropped(self, *args, crop_margin, crop_feather, **kwargs):
+        image, mask = kwargs.get("inpaint_image"), kwargs.get("inpaint_mask")
+        if not isinstance(image, Image.Image) or not isinstance(mask, Image.Image):
+            raise ValueError("crop_to_mask needs a single PIL inpaint_image and inpaint_mask")
+        if kwargs.get("output_type", "pil") != "pil":
+            raise ValueError("crop_to_mask only supports output_type='pil'")
+        width = kwargs.get("width") or image.width
+        height = kwargs.get("height") or image.height
+        crop = MaskCrop.from_mask(image, mask, width, height, margin=crop_margin, feather=crop_feather)
+        if crop is None:
+            return self(*args, **kwargs)
+        kwargs.update(inpaint_image=crop.image, inpaint_mask=crop.mask, width=crop.width, height=crop.height)
+        if isinstance(kwargs.get("control_image"), Image.Image):
+            kwargs["control_image"] = crop.crop(kwargs["control_image"])
+        output = self(*args, **kwargs)
+        images = output.images if hasattr(output, "images") else output[0]
+        images[0] = crop.paste(images[0])
+        return output
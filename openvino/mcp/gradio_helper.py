@@ -7,9 +7,22 @@ from typing import List
 from qwen_agent.gui.utils import convert_history_to_chatbot
 from qwen_agent.llm.schema import Message
 from qwen_agent.gui import WebUI
+from qwen_agent.gui.gradio_dep import gr
+
+from history_manager import HistoryManager
+from llm_serving import run_in_session
+from tool_cache import ToolResultCache, cache_tool_results
 
 
 class OpenVINOUI(WebUI):
+    def __init__(self, agent, chatbot_config: dict = None, tool_cache: ToolResultCache = None, history_manager: HistoryManager = None):
+        super().__init__(agent, chatbot_config=chatbot_config)
+        self.history_manager = history_manager
+        # one cache for every agent and session; pass ToolResultCache(ttl=0) to turn it off
+        self.tool_cache = tool_cache or ToolResultCache()
+        for agent in self.agent_list:
+            cache_tool_results(agent, self.tool_cache)
+
     def run(
         self,
         messages: List[Message] = None,
@@ -122,6 +135,14 @@ class OpenVINOUI(WebUI):
 
         demo.queue(default_concurrency_limit=concurrency_limit).launch(share=share, server_name=server_name, server_port=server_port)
 
+    def agent_run(self, _chatbot, _history, _agent_selector=None, request: gr.Request = None):
+        # tag the run with the Gradio session so the continuous-batching backend can schedule sessions fairly
+        session = request.session_hash if request is not None else None
+        if self.history_manager is not None and _history:
+            # compacted in place: the trimmed history is what later turns build on, so it is only tokenized once
+            _history[:] = self.history_manager.compact(_history)
+        yield from run_in_session(session, super().agent_run, _chatbot, _history, _agent_selector)
+
     def _create_agent_plugins_block(self, agent_index=0):
         from qwen_agent.gui.gradio_dep import gr
 
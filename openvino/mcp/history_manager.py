@@ -0,0 +1,100 @@
+# history_manager.py
+# Qompass AI - Token-budgeted conversation history for the MCP agent
+# Copyright (C) 2025 Qompass AI, All rights reserved
+# ----------------------------------------
+import copy
+import hashlib
+from collections import OrderedDict
+from typing import List
+
+from qwen_agent.llm.schema import CONTENT, FUNCTION, ROLE, USER
+from qwen_agent.log import logger
+
+
+def message_text(message) -> str:
+    content = message.get(CONTENT) or ""
+    if not isinstance(content, str):
+        content = "".join((item.get("text") if isinstance(item, dict) else getattr(item, "text", None)) or "" for item in content)
+    function_call = message.get("function_call")
+    if function_call:
+        name = function_call.get("name") if isinstance(function_call, dict) else function_call.name
+        arguments = function_call.get("arguments") if isinstance(function_call, dict) else function_call.arguments
+        content += f"{name}{arguments}"
+    return content
+
+
+class HistoryManager:
+    """Keeps the agent history under ``max_tokens`` model tokens before each turn.
+
+    Tool results from earlier turns are cut to ``max_tool_tokens``, then whole turns are dropped oldest first
+    (beyond ``max_turns``, or while over budget). The newest turn is never touched. Token counts come from the
+    model's own tokenizer and are memoized per message text, so each message is tokenized once; a tool result is
+    tokenized once more when it is cut, and marked so later turns leave it alone.
+    """
+
+    def __init__(self, tokenizer, max_tokens=4096, max_turns=8, max_tool_tokens=256, count_cache_size=4096):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.max_tool_tokens = max_tool_tokens
+        self.count_cache_size = count_cache_size
+        self._counts = OrderedDict()
+
+    @classmethod
+    def from_model_dir(cls, model_dir, **kwargs):
+        import openvino_genai as ov_genai
+
+        return cls(ov_genai.Tokenizer(str(model_dir)), **kwargs)
+
+    def _token_ids(self, text):
+        return self.tokenizer.encode(text, add_special_tokens=False).input_ids.data[0]
+
+    def count(self, text) -> int:
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        if key in self._counts:
+            self._counts.move_to_end(key)
+            return self._counts[key]
+        count = len(self._token_ids(text)) if text else 0
+        self._counts[key] = count
+        if len(self._counts) > self.count_cache_size:
+            self._counts.popitem(last=False)
+        return count
+
+    def _truncate_tool_result(self, message):
+        # already-cut results carry a marker in ``extra``: their text (limit + notice) is over the limit by design and
+        # would otherwise be cut again, and grow another notice, on every later turn
+        extra = message.get("extra") or {}
+        if extra.get("truncated"):
+            return message
+        text = message_text(message)
+        if self.count(text) <= self.max_tool_tokens:
+            return message
+        token_ids = self._token_ids(text)
+        truncated = copy.copy(message)
+        truncated[CONTENT] = self.tokenizer.decode(token_ids[: self.max_tool_tokens].tolist()) + f"\n[... {len(token_ids) - self.max_tool_tokens} more tokens of tool output truncated]"
+        truncated["extra"] = {**extra, "truncated": True}
+        return truncated
+
+    @staticmethod
+    def split_turns(messages) -> List[list]:
+        turns = []
+        for message in messages:
+            if message[ROLE] == USER or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def compact(self, messages):
+        turns = self.split_turns(messages)
+        if not turns:
+            return list(messages)
+        before = sum(self.count(message_text(message)) for message in messages)
+        turns = turns[-self.max_turns :] if self.max_turns else turns
+        turns = [[self._truncate_tool_result(message) if message[ROLE] == FUNCTION else message for message in turn] for turn in turns[:-1]] + turns[-1:]
+        sizes = [sum(self.count(message_text(message)) for message in turn) for turn in turns]
+        while len(turns) > 1 and sum(sizes) > self.max_tokens:
+            turns.pop(0)
+            sizes.pop(0)
+        compacted = [message for turn in turns for message in turn]
+        logger.info(f"history {before} -> {sum(sizes)} tokens ({len(messages)} -> {len(compacted)} messages, budget {self.max_tokens})")
+        return compacted
@@ -0,0 +1,185 @@
+# llm_benchmark.py
+# Qompass AI - Runtime comparison of converted LLM precision variants
+# Copyright (C) 2025 Qompass AI, All rights reserved
+# ----------------------------------------
+import argparse
+import gc
+import json
+import multiprocessing
+import platform
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from llm_config import SUPPORTED_OPTIMIZATIONS
+
+SAMPLE_PATH = Path(__file__).with_name("benchmark_sample.txt")
+PROMPT_SUFFIX = "\n\nSummarize the text above in three sentences."
+
+
+def find_variants(model_dir):
+    # every converted precision that sits next to ``model_dir`` (``<model>/FP16``, ``<model>/INT4_compressed_weights``, ...)
+    root = Path(model_dir).parent
+    variants = {}
+    for precision in SUPPORTED_OPTIMIZATIONS:
+        variant_dir = root / (precision if precision == "FP16" else precision + "_compressed_weights")
+        if (variant_dir / "openvino_model.xml").exists():
+            variants[precision] = variant_dir
+    return variants
+
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if platform.system() == "Darwin" else peak / 1024
+
+
+def prompt_of_length(tokenizer, sample_ids, length):
+    ids = (sample_ids * (length // len(sample_ids) + 1))[:length]
+    return tokenizer.decode(ids) + PROMPT_SUFFIX
+
+
+def perplexity_proxy(model_dir, device, token_ids, chunk_size=256):
+    # Perplexity of the raw stateful model on the bundled sample, fed in chunks so the logits stay small.
+    import openvino as ov
+
+    core = ov.Core()
+    model = core.read_model(Path(model_dir) / "openvino_model.xml")
+    input_names = {port.get_any_name() for port in model.inputs}
+    request = core.compile_model(model, device).create_infer_request()
+    request.reset_state()
+    nll, count, past, last_logits = 0.0, 0, 0, None
+    for start in range(0, len(token_ids), chunk_size):
+        ids = np.array([token_ids[start : start + chunk_size]], dtype=np.int64)
+        length = ids.shape[1]
+        inputs = {"input_ids": ids, "attention_mask": np.ones((1, past + length), dtype=np.int64)}
+        if "position_ids" in input_names:
+            inputs["position_ids"] = np.arange(past, past + length, dtype=np.int64)[None]
+        if "beam_idx" in input_names:
+            inputs["beam_idx"] = np.zeros(1, dtype=np.int32)
+        request.infer(inputs)
+        logits = request.get_output_tensor(0).data[0].astype(np.float32)
+        # logits at position i predict token i + 1; the previous chunk's last position predicts this chunk's first token
+        if last_logits is None:
+            predictions, targets = logits[:-1], ids[0, 1:]
+        else:
+            predictions, targets = np.concatenate([last_logits[None], logits[:-1]]), ids[0]
+        peak = predictions.max(axis=-1, keepdims=True)
+        log_norm = peak[:, 0] + np.log(np.exp(predictions - peak).sum(axis=-1))
+        nll += float((log_norm - predictions[np.arange(len(targets)), targets]).sum())
+        count += len(targets)
+        last_logits, past = logits[-1], past + length
+    return float(np.exp(nll / count)) if count else float("nan")
+
+
+def benchmark_variant(model_dir, device="CPU", prompt_lengths=(128, 512, 2048), max_new_tokens=64, repeats=3, perplexity_tokens=1024):
+    import openvino_genai as ov_genai
+
+    start = time.perf_counter()
+    pipe = ov_genai.LLMPipeline(str(model_dir), device)
+    load_seconds = time.perf_counter() - start
+    tokenizer = pipe.get_tokenizer()
+    sample_ids = tokenizer.encode(SAMPLE_PATH.read_text(), add_special_tokens=False).input_ids.data[0].tolist()
+
+    config = ov_genai.GenerationConfig()
+    config.max_new_tokens = max_new_tokens
+    # a fixed number of new tokens keeps tokens/s comparable across variants
+    config.ignore_eos = True
+    pipe.generate(prompt_of_length(tokenizer, sample_ids, min(prompt_lengths)), config)
+
+    by_length = {}
+    for length in prompt_lengths:
+        prompt = prompt_of_length(tokenizer, sample_ids, length)
+        ttft, throughput = [], []
+        for _ in range(repeats):
+            metrics = pipe.generate([prompt], config).perf_metrics
+            ttft.append(metrics.get_ttft().mean)
+            throughput.append(metrics.get_throughput().mean)
+        by_length[str(length)] = {
+            "prompt_tokens": metrics.get_num_input_tokens(),
+            "ttft_ms": statistics.median(ttft),
+            "tokens_per_second": statistics.median(throughput),
+        }
+    del pipe
+    gc.collect()
+
+    return {
+        "model_dir": str(model_dir),
+        "size_mb": sum(path.stat().st_size for path in Path(model_dir).glob("*.bin")) / 1024**2,
+        "load_seconds": load_seconds,
+        "prompt_lengths": by_length,
+        "perplexity": perplexity_proxy(model_dir, device, sample_ids[:perplexity_tokens]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_benchmark(model_dir, device="CPU", precisions=None, **kwargs):
+    # Each variant runs in a fresh process so load time and peak RSS are not skewed by the variants before it.
+    variants = find_variants(model_dir)
+    if precisions:
+        variants = {precision: path for precision, path in variants.items() if precision in precisions}
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for precision, variant_dir in variants.items():
+        print(f"⌛ Benchmarking {precision} ({variant_dir})")
+        with context.Pool(1) as pool:
+            try:
+                results[precision] = pool.apply(benchmark_variant, (variant_dir, device), kwargs)
+            except Exception as exc:
+                results[precision] = {"model_dir": str(variant_dir), "error": repr(exc)}
+                print(f"❌ {precision}: {exc!r}")
+    return {"device": device, "sample": SAMPLE_PATH.name, "settings": kwargs, "variants": results}
+
+
+def markdown_table(report):
+    variants = {precision: result for precision, result in report["variants"].items() if "error" not in result}
+    if not variants:
+        return "No variant could be benchmarked."
+    lengths = list(next(iter(variants.values()))["prompt_lengths"])
+    header = ["Precision", "Size, MB", "Load, s", "Peak RSS, MB", "Perplexity"]
+    header += [f"TTFT @{length}, ms" for length in lengths] + [f"Tokens/s @{length}" for length in lengths]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    for precision, result in variants.items():
+        row = [precision, f"{result['size_mb']:.0f}", f"{result['load_seconds']:.1f}", f"{result['peak_rss_mb']:.0f}", f"{result['perplexity']:.2f}"]
+        row += [f"{result['prompt_lengths'][length]['ttft_ms']:.0f}" for length in lengths]
+        row += [f"{result['prompt_lengths'][length]['tokens_per_second']:.1f}" for length in lengths]
+        lines.append("| " + " | ".join(row) + " |")
+    return "\n".join(lines)
+
+
+def write_report(report, output_prefix):
+    output_prefix = Path(output_prefix)
+    output_prefix.parent.mkdir(parents=True, exist_ok=True)
+    output_prefix.with_suffix(".json").write_text(json.dumps(report, indent=2))
+    output_prefix.with_suffix(".md").write_text(markdown_table(report) + "\n")
+    return output_prefix.with_suffix(".json"), output_prefix.with_suffix(".md")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the runtime behaviour of every converted precision of a model")
+    parser.add_argument("-m", "--model_dir", required=True, help="Any converted variant directory of the model, e.g. Qwen3-8B/INT4_compressed_weights")
+    parser.add_argument("-d", "--device", default="CPU", help="Device for inference")
+    parser.add_argument("--precisions", nargs="*", default=None, help="Subset of precisions to run")
+    parser.add_argument("--prompt_lengths", nargs="*", type=int, default=[128, 512, 2048], help="Prompt lengths in tokens")
+    parser.add_argument("--max_new_tokens", type=int, default=64, help="Tokens generated per prompt")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per prompt length; the median is reported")
+    parser.add_argument("--perplexity_tokens", type=int, default=1024, help="Sample tokens used for the perplexity proxy")
+    parser.add_argument("-o", "--output", default="llm_benchmark", help="Output path prefix for the .json and .md reports")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.model_dir,
+        args.device,
+        args.precisions,
+        prompt_lengths=tuple(args.prompt_lengths),
+        max_new_tokens=args.max_new_tokens,
+        repeats=args.repeats,
+        perplexity_tokens=args.perplexity_tokens,
+    )
+    print(markdown_table(report))
+    json_path, md_path = write_report(report, args.output)
+    print(f"✅ Report written to {json_path} and {md_path}")
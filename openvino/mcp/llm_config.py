@@ -6,6 +6,7 @@ SUPPORTED_LLM_MODELS = {
     "English": {
         "Qwen/Qwen3-8B": {
             "model_id": "Qwen/Qwen3-8B",
+            "draft_model_id": "Qwen/Qwen3-4B",
         },
         "Qwen/Qwen3-4B": {
             "model_id": "Qwen/Qwen3-4B",
@@ -14,6 +15,7 @@ SUPPORTED_LLM_MODELS = {
     "Chinese": {
         "Qwen/Qwen3-8B": {
             "model_id": "Qwen/Qwen3-8B",
+            "draft_model_id": "Qwen/Qwen3-4B",
         },
         "Qwen/Qwen3-4B": {
             "model_id": "Qwen/Qwen3-4B",
@@ -113,9 +115,65 @@ def get_llm_selection_widget(
     return form, lang_dropdown, model_dropdown, compression_dropdown, preconverted_checkbox
 
 
-def convert_and_compress_model(model_id, model_config, precision, use_preconverted=False):
+CONVERSION_MANIFEST = "conversion_manifest.json"
+
+
+def get_source_revision(model_id):
     from pathlib import Path
-    from IPython.display import Markdown, display
+
+    if Path(model_id).exists():
+        return "local"
+    try:
+        import huggingface_hub as hf_hub
+
+        return hf_hub.HfApi().model_info(model_id).sha
+    except Exception:
+        # offline: the revision cannot be checked, so any manifest with the same command is accepted
+        return None
+
+
+def read_conversion_manifest(model_dir):
+    import json
+
+    try:
+        return json.loads((model_dir / CONVERSION_MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def is_conversion_complete(model_dir, command, source_revision=None, compression_options=None):
+    # Valid only if the manifest describes the same export and every file it lists is still there at full size.
+    manifest = read_conversion_manifest(model_dir)
+    if manifest is None or manifest.get("command") != command or manifest.get("compression_options") != (compression_options or {}):
+        return False
+    if source_revision is not None and manifest.get("source_revision") != source_revision:
+        return False
+    for name, size in manifest.get("files", {}).items():
+        path = model_dir / name
+        if not path.is_file() or path.stat().st_size != size:
+            return False
+    return True
+
+
+def _publish_conversion(tmp_dir, model_dir, command, source_revision, compression_options):
+    # the manifest is written last and the directory swapped in whole, so a partial export never looks complete
+    import hashlib
+    import json
+    import os
+    import shutil
+
+    payload = {"command": command, "source_revision": source_revision, "compression_options": compression_options or {}}
+    files = {path.relative_to(tmp_dir).as_posix(): path.stat().st_size for path in sorted(tmp_dir.rglob("*")) if path.is_file()}
+    manifest = {**payload, "hash": hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest(), "files": files}
+    (tmp_dir / CONVERSION_MANIFEST).write_text(json.dumps(manifest, indent=2))
+    if model_dir.exists():
+        shutil.rmtree(model_dir)
+    os.replace(tmp_dir, model_dir)
+
+
+def convert_and_compress_model(model_id, model_config, precision, use_preconverted=False, quiet=False):
+    from pathlib import Path
+    import shutil
     import subprocess  # nosec - disable B404:import-subprocess check
     import platform
 
@@ -123,37 +181,142 @@ def convert_and_compress_model(model_id, model_config, precision, use_preconvert
     pt_model_name = model_id.split("/")[-1]
     model_subdir = precision if precision == "FP16" else precision + "_compressed_weights"
     model_dir = Path(pt_model_name) / model_subdir
+    tmp_dir = model_dir.with_name(model_dir.name + ".partial")
     remote_code = model_config.get("remote_code", False)
-    if (model_dir / "openvino_model.xml").exists():
+
+    model_compression_params = {}
+    if "INT4" in precision:
+        model_compression_params = compression_configs.get(model_id, compression_configs["default"]) if not "NPU" in precision else int4_npu_config
+    weight_format = precision.split("-")[0].lower()
+    optimum_cli_command = get_optimum_cli_command(pt_model_id, weight_format, model_dir, model_compression_params, "AWQ" in precision, remote_code)
+    source_revision = get_source_revision(pt_model_id)
+    if is_conversion_complete(model_dir, optimum_cli_command, source_revision, model_compression_params):
         print(f"✅ {precision} {model_id} model already converted and can be found in {model_dir}")
         return model_dir
+
     if use_preconverted:
         OV_ORG = "OpenVINO"
         pt_model_name = pt_model_id.split("/")[-1]
         ov_model_name = pt_model_name + f"-{precision.lower()}-ov"
         ov_model_hub_id = f"{OV_ORG}/{ov_model_name}"
+        download_command = f"snapshot_download {ov_model_hub_id}"
         import huggingface_hub as hf_hub
 
         hub_api = hf_hub.HfApi()
+        if is_conversion_complete(model_dir, download_command):
+            print(f"✅ {precision} {model_id} model already downloaded and can be found in {model_dir}")
+            return model_dir
         if hub_api.repo_exists(ov_model_hub_id):
             print(f"⌛Found preconverted {precision} {model_id}. Downloading model started. It may takes some time.")
-            hf_hub.snapshot_download(ov_model_hub_id, local_dir=model_dir)
+            revision = hub_api.model_info(ov_model_hub_id).sha
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            hf_hub.snapshot_download(ov_model_hub_id, local_dir=tmp_dir, revision=revision)
+            _publish_conversion(tmp_dir, model_dir, download_command, revision, None)
             print(f"✅ {precision} {model_id} model downloaded and can be found in {model_dir}")
             return model_dir
 
-    model_compression_params = {}
-    if "INT4" in precision:
-        model_compression_params = compression_configs.get(model_id, compression_configs["default"]) if not "NPU" in precision else int4_npu_config
-    weight_format = precision.split("-")[0].lower()
-    optimum_cli_command = get_optimum_cli_command(pt_model_id, weight_format, model_dir, model_compression_params, "AWQ" in precision, remote_code)
     print(f"⌛ {model_id} conversion to {precision} started. It may takes some time.")
-    display(Markdown("**Export command:**"))
-    display(Markdown(f"`{optimum_cli_command}`"))
-    subprocess.run(optimum_cli_command.split(" "), shell=(platform.system() == "Windows"), check=True)
+    if not quiet:
+        from IPython.display import Markdown, display
+
+        display(Markdown("**Export command:**"))
+        display(Markdown(f"`{optimum_cli_command}`"))
+    # a stale or partial export is discarded, not resumed: optimum-cli cannot continue an interrupted export
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.parent.mkdir(parents=True, exist_ok=True)
+    run_command = get_optimum_cli_command(pt_model_id, weight_format, tmp_dir, model_compression_params, "AWQ" in precision, remote_code)
+    if quiet:
+        log_path = tmp_dir.with_name(tmp_dir.name + ".log")
+        with open(log_path, "w") as log:
+            subprocess.run(run_command.split(" "), shell=(platform.system() == "Windows"), check=True, stdout=log, stderr=subprocess.STDOUT)
+        log_path.unlink()
+    else:
+        subprocess.run(run_command.split(" "), shell=(platform.system() == "Windows"), check=True)
+    _publish_conversion(tmp_dir, model_dir, optimum_cli_command, source_revision, model_compression_params)
     print(f"✅ {precision} {model_id} model converted and can be found in {model_dir}")
     return model_dir
 
 
+def estimate_conversion_memory(model_id):
+    # optimum-cli holds the original checkpoint and the OpenVINO model it builds from it: about twice the checkpoint
+    from pathlib import Path
+
+    if Path(model_id).exists():
+        checkpoint = sum(path.stat().st_size for path in Path(model_id).rglob("*") if path.suffix in (".safetensors", ".bin"))
+    else:
+        try:
+            import huggingface_hub as hf_hub
+
+            siblings = hf_hub.HfApi().model_info(model_id, files_metadata=True).siblings
+        except Exception:
+            return None
+        checkpoint = sum(sibling.size or 0 for sibling in siblings if sibling.rfilename.endswith((".safetensors", ".bin")))
+    return 2 * checkpoint or None
+
+
+def available_memory():
+    try:
+        import psutil
+
+        return psutil.virtual_memory().available
+    except ImportError:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    return None
+
+
+def max_parallel_conversions(model_id, num_jobs, reserve=0.1):
+    import os
+
+    limit = min(num_jobs, max(1, (os.cpu_count() or 1) // 4))
+    per_job, available = estimate_conversion_memory(model_id), available_memory()
+    if per_job and available:
+        limit = min(limit, int(available * (1 - reserve) // per_job))
+    return max(1, limit)
+
+
+def convert_and_compress_models(model_id, model_config, precisions=None, use_preconverted=False, max_workers=None):
+    # Several precision variants at once; outputs with a valid manifest are skipped, stale or partial ones redone.
+    from concurrent.futures import ThreadPoolExecutor
+
+    precisions = list(precisions or SUPPORTED_OPTIMIZATIONS)
+    max_workers = max_workers or max_parallel_conversions(model_config["model_id"], len(precisions))
+    print(f"⌛ Converting {model_id} to {', '.join(precisions)} with up to {max_workers} parallel jobs")
+    results, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {precision: executor.submit(convert_and_compress_model, model_id, model_config, precision, use_preconverted, True) for precision in precisions}
+        for precision, future in futures.items():
+            try:
+                results[precision] = future.result()
+            except Exception as exc:
+                failed[precision] = exc
+                print(f"❌ {precision} {model_id} conversion failed: {exc!r}")
+    return results, failed
+
+
+def get_draft_model_config(model_config):
+    draft_model_id = model_config.get("draft_model_id")
+    if draft_model_id is None:
+        return None, None
+    for models in SUPPORTED_LLM_MODELS.values():
+        if draft_model_id in models:
+            return draft_model_id, models[draft_model_id]
+    return draft_model_id, {"model_id": draft_model_id}
+
+
+def convert_speculative_pair(model_id, model_config, precision, draft_precision="INT4", use_preconverted=False):
+    # Target and draft model for speculative decoding; the draft shares the tokenizer, so it must come from the same family.
+    model_dir = convert_and_compress_model(model_id, model_config, precision, use_preconverted)
+    draft_model_id, draft_config = get_draft_model_config(model_config)
+    if draft_model_id is None:
+        print(f"⚠️ {model_id} has no draft model configured, speculative decoding is not available")
+        return model_dir, None
+    draft_model_dir = convert_and_compress_model(draft_model_id, draft_config, draft_precision, use_preconverted)
+    return model_dir, draft_model_dir
+
+
 def compare_model_size(model_dir):
     fp16_weights = model_dir.parent / "FP16" / "openvino_model.bin"
     int8_weights = model_dir.parent / "INT8_compressed_weights" / "openvino_model.bin"
@@ -168,3 +331,15 @@ def compare_model_size(model_dir):
             print(f"Size of model with {precision} compressed weights is {compressed_weights.stat().st_size / 1024 / 1024:.2f} MB")
         if compressed_weights.exists() and fp16_weights.exists():
             print(f"Compression rate for {precision} model: {fp16_weights.stat().st_size / compressed_weights.stat().st_size:.3f}")
+
+
+def compare_model_performance(model_dir, device="CPU", output_prefix=None, **kwargs):
+    # Load time, TTFT, tokens/s, peak RSS and a perplexity proxy for every converted precision next to ``model_dir``.
+    from IPython.display import Markdown, display
+    from llm_benchmark import markdown_table, run_benchmark, write_report
+
+    report = run_benchmark(model_dir, device, **kwargs)
+    if output_prefix:
+        write_report(report, output_prefix)
+    display(Markdown(markdown_table(report)))
+    return report
@@ -0,0 +1,446 @@
+# llm_serving.py
+# Qompass AI - Continuous-batching OpenVINO GenAI backend for the MCP agent
+# Copyright (C) 2025 Qompass AI, All rights reserved
+# ----------------------------------------
+import contextvars
+import hashlib
+import itertools
+import json
+import queue
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from qwen_agent.llm.base import register_llm
+from qwen_agent.llm.function_calling import BaseFnCallModel
+from qwen_agent.llm.schema import ASSISTANT, Message
+from qwen_agent.log import logger
+
+from shared_weights import memory_report
+
+THINK_START, THINK_END = "<think>", "</think>"
+
+# Set by OpenVINOUI for the duration of a Gradio session's agent run; used to share the scheduler fairly.
+current_session = contextvars.ContextVar("current_session", default=None)
+
+
+def run_in_session(session_id, generator_fn, *args, **kwargs):
+    # Drive a generator inside a context where ``current_session`` is set, for every resume, even when Gradio
+    # resumes it from different worker threads.
+    context = contextvars.copy_context()
+    context.run(current_session.set, session_id)
+    generator = context.run(generator_fn, *args, **kwargs)
+    while True:
+        try:
+            item = context.run(next, generator)
+        except StopIteration:
+            return
+        yield item
+
+
+def strip_thinking(text):
+    # The visible part of a Qwen3 reply: a leading <think>...</think> block (empty under /no_think) is dropped, and
+    # nothing is shown while it may still be opening or is still open. Grows monotonically as ``text`` does.
+    stripped = text.lstrip()
+    if not stripped.startswith(THINK_START):
+        return "" if THINK_START.startswith(stripped) else text
+    end = stripped.find(THINK_END)
+    return "" if end < 0 else stripped[end + len(THINK_END) :].lstrip()
+
+
+def kv_cache_blocks(model_dir, cache_size, block_size=32, kv_cache_bytes=1):
+    # How many KV blocks fit in ``cache_size`` GB, from the model's config.json; u8 KV cache is the CPU default.
+    config = json.loads((Path(model_dir) / "config.json").read_text())
+    kv_heads = config.get("num_key_value_heads", config["num_attention_heads"])
+    head_dim = config.get("head_dim", config["hidden_size"] // config["num_attention_heads"])
+    bytes_per_token = 2 * config["num_hidden_layers"] * kv_heads * head_dim * kv_cache_bytes
+    return int(cache_size * 1024**3 // (bytes_per_token * block_size))
+
+
+class PrefixCacheEstimate:
+    """Estimates how much of each prompt the pipeline's block-level prefix cache reuses, by replaying it (chained
+    block hashes, LRU) next to the scheduler.
+
+    This is a simulation, not a measurement: it assumes the whole ``max_blocks`` pool holds prefix blocks and ignores
+    blocks pinned by running sequences, so the real hit rate is at most what it reports.
+    """
+
+    def __init__(self, block_size=32, max_blocks=None):
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.requests = 0
+        self.hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._blocks = OrderedDict()
+
+    def observe(self, token_ids):
+        cached, parent, matching = 0, b"", True
+        for start in range(0, len(token_ids) - self.block_size + 1, self.block_size):
+            key = hashlib.blake2b(parent + array("q", token_ids[start : start + self.block_size]).tobytes(), digest_size=16).digest()
+            if matching and key in self._blocks:
+                cached += self.block_size
+                self._blocks.move_to_end(key)
+            else:
+                matching = False
+                self._blocks[key] = None
+            parent = key
+        while self.max_blocks and len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        self.requests += 1
+        self.hits += cached > 0
+        self.prompt_tokens += len(token_ids)
+        self.cached_tokens += cached
+        return cached
+
+    def stats(self):
+        return {
+            "estimated_prefix_requests": self.requests,
+            "estimated_prefix_hit_rate": self.hits / self.requests if self.requests else 0.0,
+            "estimated_prefix_token_hit_rate": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            "estimated_prefix_cached_tokens": self.cached_tokens,
+            "estimated_prefix_blocks": len(self._blocks),
+            "estimated_prefix_max_blocks": self.max_blocks,
+        }
+
+
+class _Request:
+    def __init__(self, request_id, session, prompt, generation_config):
+        self.request_id = request_id
+        self.session = session
+        self.prompt = prompt
+        self.generation_config = generation_config
+        self.input_ids = None
+        self.handle = None
+        self.submitted_at = time.perf_counter()
+        self.first_token_at = None
+        self.generated_tokens = 0
+        self.decode_steps = 0
+        self.outputs = queue.Queue()
+        self.cancelled = False
+        self.finished = False
+
+
+class ContinuousBatchingServer:
+    """One ContinuousBatchingPipeline (paged KV cache) stepped by a background thread for every session.
+
+    Requests wait in per-session queues and are admitted round-robin, at most ``max_num_seqs`` at a time and
+    ``max_sequences_per_session`` per session, so one busy user cannot crowd the others out of the batch.
+
+    With ``enable_prefix_caching`` the KV blocks of a shared prompt prefix (system message, tool schemas) are
+    computed once and reused by later requests. Cached blocks live in the same ``cache_size`` GB pool as running
+    sequences and are evicted least-recently-used when it fills, so the pool size is also the prefix cache cap.
+
+    With ``draft_model_dir`` a smaller model of the same family proposes ``num_assistant_tokens`` tokens per step and
+    the main model verifies them in one pass (speculative decoding).
+    """
+
+    def __init__(
+        self,
+        model_dir,
+        device="CPU",
+        cache_size=8,
+        max_num_seqs=16,
+        max_sequences_per_session=2,
+        max_num_batched_tokens=None,
+        enable_prefix_caching=True,
+        block_size=32,
+        draft_model_dir=None,
+        draft_device=None,
+        num_assistant_tokens=5,
+        properties=None,
+    ):
+        import openvino_genai as ov_genai
+
+        scheduler_config = ov_genai.SchedulerConfig()
+        scheduler_config.cache_size = cache_size
+        scheduler_config.max_num_seqs = max_num_seqs
+        scheduler_config.dynamic_split_fuse = True
+        scheduler_config.enable_prefix_caching = enable_prefix_caching
+        if max_num_batched_tokens:
+            scheduler_config.max_num_batched_tokens = max_num_batched_tokens
+
+        properties = dict(properties or {})
+        self.num_assistant_tokens = None
+        if draft_model_dir:
+            properties["draft_model"] = ov_genai.draft_model(str(draft_model_dir), draft_device or device)
+            self.num_assistant_tokens = num_assistant_tokens
+
+        self.ov_genai = ov_genai
+        self.pipe = ov_genai.ContinuousBatchingPipeline(str(model_dir), scheduler_config, device, properties)
+        self.tokenizer = self.pipe.get_tokenizer()
+        self.prefix_estimate = None
+        if enable_prefix_caching:
+            try:
+                max_blocks = kv_cache_blocks(model_dir, cache_size, block_size)
+            except (OSError, KeyError, ValueError):
+                max_blocks = None
+            self.prefix_estimate = PrefixCacheEstimate(block_size, max_blocks)
+        self._ttft = deque(maxlen=256)
+        # (generated tokens, decode seconds, decode steps) of recently finished requests
+        self._decode = deque(maxlen=256)
+        self.max_num_seqs = max_num_seqs
+        self.max_sequences_per_session = max_sequences_per_session
+        self._pending = OrderedDict()
+        self._active = {}
+        self._ids = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="ov-genai-cb", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, generation_config, session=None) -> _Request:
+        request_id = next(self._ids)
+        request = _Request(request_id, session if session is not None else f"request-{request_id}", prompt, generation_config)
+        # tokenize on the caller's thread so the stepping thread only schedules
+        request.input_ids = self.tokenizer.encode(prompt).input_ids
+        with self._cond:
+            self._pending.setdefault(request.session, deque()).append(request)
+            self._cond.notify_all()
+        return request
+
+    def cancel(self, request):
+        with self._cond:
+            request.cancelled = True
+            self._cond.notify_all()
+
+    def generate(self, prompt, generation_config, session=None) -> Iterator[str]:
+        request = self.submit(prompt, generation_config, session if session is not None else current_session.get())
+        token_ids, emitted = [], ""
+        try:
+            while True:
+                item = request.outputs.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                token_ids.extend(item)
+                text = self.tokenizer.decode(token_ids)
+                # hold back an incomplete multi-byte character until its remaining tokens arrive
+                if text.endswith("�") or len(text) <= len(emitted):
+                    continue
+                yield text[len(emitted) :]
+                emitted = text
+        finally:
+            if not request.finished:
+                self.cancel(request)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                "active_sequences": len(self._active),
+                "pending_requests": sum(len(requests) for requests in self._pending.values()),
+                "sessions_waiting": sum(1 for requests in self._pending.values() if requests),
+                "avg_ttft_ms": 1000 * sum(self._ttft) / len(self._ttft) if self._ttft else 0.0,
+            }
+            tokens = sum(item[0] for item in self._decode)
+            seconds = sum(item[1] for item in self._decode)
+            steps = sum(item[2] for item in self._decode)
+            stats["decode_tokens_per_second"] = tokens / seconds if seconds else 0.0
+            if self.num_assistant_tokens:
+                # every verify step yields one token from the main model plus the accepted draft tokens
+                stats["speculative_acceptance_rate"] = (tokens - steps) / (steps * self.num_assistant_tokens) if steps else 0.0
+                stats["tokens_per_step"] = tokens / steps if steps else 0.0
+            if self.prefix_estimate is not None:
+                stats.update(self.prefix_estimate.stats())
+        # this process's RSS split into unique (USS) and shared pages; see shared_weights.py to compare workers
+        stats.update({f"{name}_mb": value / 1024**2 for name, value in memory_report().items()})
+        metrics = self.pipe.get_metrics()
+        for name in ("requests", "scheduled_requests", "cache_usage", "max_cache_usage", "avg_cache_usage"):
+            if hasattr(metrics, name):
+                stats[name] = getattr(metrics, name)
+        return stats
+
+    def _admit(self):
+        per_session = {}
+        for request in self._active.values():
+            per_session[request.session] = per_session.get(request.session, 0) + 1
+        admitted = True
+        while admitted and len(self._active) < self.max_num_seqs:
+            admitted = False
+            for session in list(self._pending):
+                requests = self._pending[session]
+                while requests and requests[0].cancelled:
+                    self._finish(requests.popleft())
+                if not requests:
+                    del self._pending[session]
+                    continue
+                if per_session.get(session, 0) >= self.max_sequences_per_session or len(self._active) >= self.max_num_seqs:
+                    continue
+                request = requests.popleft()
+                try:
+                    prompt_tokens = request.input_ids.get_shape()[-1]
+                    if self.prefix_estimate is not None:
+                        cached = self.prefix_estimate.observe(request.input_ids.data[0].tolist())
+                        logger.info(f"prefill {prompt_tokens} tokens, an estimated {cached} at most reusable from the prefix cache")
+                    else:
+                        logger.info(f"prefill {prompt_tokens} tokens")
+                    request.handle = self.pipe.add_request(request.request_id, request.input_ids, request.generation_config)
+                except Exception as exc:
+                    request.outputs.put(exc)
+                    self._finish(request)
+                    continue
+                self._active[request.request_id] = request
+                per_session[session] = per_session.get(session, 0) + 1
+                # rotate: the session just served goes to the back of the line
+                self._pending.move_to_end(session)
+                admitted = True
+
+    def _finish(self, request):
+        request.finished = True
+        request.outputs.put(None)
+
+    def _collect(self):
+        running = self.ov_genai.GenerationStatus.RUNNING
+        for request_id, request in list(self._active.items()):
+            handle = request.handle
+            if request.cancelled:
+                (getattr(handle, "stop", None) or handle.drop)()
+            step_tokens = 0
+            while handle.can_read():
+                for output in handle.read().values():
+                    if output.generated_ids:
+                        step_tokens += len(output.generated_ids)
+                        request.outputs.put(list(output.generated_ids))
+            if step_tokens:
+                if request.first_token_at is None:
+                    request.first_token_at = time.perf_counter()
+                    self._ttft.append(request.first_token_at - request.submitted_at)
+                else:
+                    # the first token comes out of prefill; the rest are decode
+                    request.generated_tokens += step_tokens
+                    request.decode_steps += 1
+            if request.cancelled or handle.get_status() != running:
+                del self._active[request_id]
+                if request.decode_steps:
+                    self._decode.append((request.generated_tokens, time.perf_counter() - request.first_token_at, request.decode_steps))
+                self._finish(request)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._active and not any(self._pending.values()):
+                    self._cond.wait()
+                if self._closed:
+                    for request in self._active.values():
+                        self._finish(request)
+                    return
+                self._admit()
+            if self._active:
+                try:
+                    self.pipe.step()
+                except Exception as exc:
+                    with self._cond:
+                        for request in self._active.values():
+                            request.outputs.put(exc)
+                            self._finish(request)
+                        self._active.clear()
+                    continue
+            with self._cond:
+                self._collect()
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_server(model_dir, device="CPU", **config) -> ContinuousBatchingServer:
+    # one server (and one KV cache) per model and device, shared by every agent and session in the process
+    key = (str(model_dir), device, tuple(sorted((name, repr(value)) for name, value in config.items())))
+    with _servers_lock:
+        if key not in _servers:
+            _servers[key] = ContinuousBatchingServer(model_dir, device, **config)
+        return _servers[key]
+
+
+SERVER_CONFIG_KEYS = (
+    "cache_size",
+    "max_num_seqs",
+    "max_sequences_per_session",
+    "max_num_batched_tokens",
+    "enable_prefix_caching",
+    "block_size",
+    "draft_model_dir",
+    "draft_device",
+    "num_assistant_tokens",
+)
+
+
+@register_llm("openvino-genai-cb")
+class OpenVINOContinuousBatching(BaseFnCallModel):
+    """Qwen-Agent LLM backed by the shared continuous-batching server; use ``"model_type": "openvino-genai-cb"``."""
+
+    def __init__(self, cfg: Dict):
+        cfg = dict(cfg)
+        cfg.setdefault("model", str(cfg["ov_model_dir"]))
+        super().__init__(cfg)
+        server_config = {name: cfg[name] for name in SERVER_CONFIG_KEYS if name in cfg}
+        self.server = get_server(cfg["ov_model_dir"], cfg.get("device", "CPU"), **server_config)
+        self.chat_template = cfg.get("genai_chat_template")
+        self.disable_thinking = cfg.get("disable_thinking", False)
+        # chat_mode keeps one conversation's KV cache between turns on the openvino-genai backend; here the prefix
+        # cache does the same for every session, so without it each turn prefills its whole history again
+        if cfg.get("chat_mode") and not server_config.get("enable_prefix_caching", True):
+            logger.warning("chat_mode needs enable_prefix_caching on openvino-genai-cb; every turn will prefill its full history")
+
+    def _build_prompt(self, messages: List[Message]) -> str:
+        history = []
+        for message in messages:
+            content = message.content
+            if not isinstance(content, str):
+                content = "".join(item.text for item in content if getattr(item, "text", None))
+            history.append({"role": message.role, "content": content})
+        if self.chat_template:
+            return self.server.tokenizer.apply_chat_template(history, add_generation_prompt=True, chat_template=self.chat_template)
+        return self.server.tokenizer.apply_chat_template(history, add_generation_prompt=True)
+
+    def _generation_config(self, generate_cfg: dict):
+        config = self.server.ov_genai.GenerationConfig()
+        config.max_new_tokens = generate_cfg.get("max_new_tokens", generate_cfg.get("max_tokens", 2048))
+        if self.server.num_assistant_tokens:
+            config.num_assistant_tokens = self.server.num_assistant_tokens
+        temperature = generate_cfg.get("temperature", 0.0)
+        if temperature and temperature > 0:
+            config.do_sample = True
+            config.temperature = temperature
+            config.top_p = generate_cfg.get("top_p", 1.0)
+            config.top_k = generate_cfg.get("top_k", 50)
+        if "repetition_penalty" in generate_cfg:
+            config.repetition_penalty = generate_cfg["repetition_penalty"]
+        if generate_cfg.get("stop"):
+            config.stop_strings = set(generate_cfg["stop"])
+        return config
+
+    def _chat_stream(self, messages: List[Message], delta_stream: bool, generate_cfg: dict) -> Iterator[List[Message]]:
+        text, shown = "", ""
+        for delta in self.server.generate(self._build_prompt(messages), self._generation_config(generate_cfg)):
+            text += delta
+            visible = strip_thinking(text) if self.disable_thinking else text
+            if len(visible) <= len(shown):
+                continue
+            yield [Message(ASSISTANT, visible[len(shown) :] if delta_stream else visible)]
+            shown = visible
+        self._log_decode_stats()
+
+    def _log_decode_stats(self):
+        stats = self.server.stats()
+        message = f"decode {stats['decode_tokens_per_second']:.1f} tokens/s, TTFT {stats['avg_ttft_ms']:.0f} ms"
+        if "speculative_acceptance_rate" in stats:
+            message += f", draft acceptance {stats['speculative_acceptance_rate']:.1%} ({stats['tokens_per_step']:.2f} tokens/step)"
+        logger.info(message)
+
+    def _chat_no_stream(self, messages: List[Message], generate_cfg: dict) -> List[Message]:
+        text = "".join(self.server.generate(self._build_prompt(messages), self._generation_config(generate_cfg)))
+        self._log_decode_stats()
+        if self.disable_thinking:
+            text = strip_thinking(text)
+        return [Message(ASSISTANT, text)]
@@ -0,0 +1,224 @@
+# mcp_pool.py
+# Qompass AI - Shared pool of long-lived MCP server processes for the MCP agent
+# Copyright (C) 2025 Qompass AI, All rights reserved
+# ----------------------------------------
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, List, Union
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+from qwen_agent.tools.base import BaseTool
+
+from tool_cache import ToolError
+
+
+class MCPServer:
+    """One long-lived MCP server process and its client session, restarted when it dies or stops answering pings.
+
+    The process and session are owned by a single task (``_serve``) because the stdio transport must be opened
+    and closed from the same task; everything else asks that task to restart by setting ``_stopped``.
+    """
+
+    def __init__(self, name, config, max_concurrency=4, start_timeout=60, call_timeout=120, restart_delay=1.0):
+        self.name = name
+        self.config = config
+        self.start_timeout = start_timeout
+        self.call_timeout = call_timeout
+        self.restart_delay = restart_delay
+        self.session = None
+        self.tools = []
+        self.starts = 0
+        self.restarts = 0
+        self.calls = 0
+        self.failures = 0
+        self.last_error = None
+        self._task = None
+        self._shutdown = False
+        self._ready = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def started(self):
+        return self._task is not None
+
+    async def _serve(self):
+        params = StdioServerParameters(command=self.config["command"], args=self.config.get("args", []), env=self.config.get("env"))
+        while not self._shutdown:
+            self._stopped.clear()
+            try:
+                async with stdio_client(params) as (read, write), ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.tools = (await session.list_tools()).tools
+                    self.session = session
+                    self.starts += 1
+                    self._ready.set()
+                    await self._stopped.wait()
+            except Exception as exc:
+                self.last_error = repr(exc)
+            finally:
+                self.session = None
+                self._ready.clear()
+            if not self._shutdown:
+                self.restarts += 1
+                await asyncio.sleep(self.restart_delay)
+
+    async def ensure_started(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._serve())
+        await asyncio.wait_for(self._ready.wait(), self.start_timeout)
+        return self.session
+
+    def restart(self):
+        # callers wait for the replacement session rather than picking up the dead one
+        self._ready.clear()
+        self._stopped.set()
+
+    async def call_tool(self, tool, arguments):
+        async with self._semaphore:
+            for attempt in range(2):
+                session = await self.ensure_started()
+                self.calls += 1
+                try:
+                    return await asyncio.wait_for(session.call_tool(tool, arguments), self.call_timeout)
+                except McpError:
+                    # the server answered with an error: it is healthy, the call was not
+                    raise
+                except asyncio.TimeoutError:
+                    # a slow call is not a dead server: fail only this call and leave restarts to the health check,
+                    # since restarting would kill every other session's call in flight on this process
+                    self.failures += 1
+                    raise
+                except Exception as exc:
+                    # broken pipe or closed stream: the process is gone, restart it and retry once
+                    self.failures += 1
+                    self.last_error = repr(exc)
+                    self.restart()
+                    if attempt:
+                        raise
+
+    async def check_health(self, timeout=10):
+        if self.session is None:
+            return
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+        except Exception as exc:
+            self.last_error = repr(exc)
+            self.restart()
+
+    async def shutdown(self):
+        self._shutdown = True
+        self._stopped.set()
+        if self._task is not None:
+            await self._task
+
+    def stats(self):
+        return {
+            "running": self.session is not None,
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "calls": self.calls,
+            "failures": self.failures,
+            "tools": [tool.name for tool in self.tools],
+            "last_error": self.last_error,
+        }
+
+
+class MCPServerPool:
+    """MCP server processes shared by every agent and session in the process, driven from one event-loop thread.
+
+    With ``prestart`` every server is spawned in the background as soon as the pool exists, so the first tool
+    call does not pay Python startup; otherwise a server starts on first use. Each server runs at most
+    ``max_concurrency`` calls at a time and is pinged every ``health_interval`` seconds.
+    """
+
+    def __init__(self, servers: Dict[str, dict], max_concurrency=4, health_interval=30, prestart=True, **server_kwargs):
+        self.health_interval = health_interval
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="mcp-pool", daemon=True)
+        self._thread.start()
+        self.servers = {name: MCPServer(name, config, max_concurrency, **server_kwargs) for name, config in servers.items()}
+        self._health = asyncio.run_coroutine_threadsafe(self._health_loop(), self.loop)
+        if prestart:
+            for server in self.servers.values():
+                asyncio.run_coroutine_threadsafe(server.ensure_started(), self.loop)
+
+    def _run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(server.check_health() for server in self.servers.values() if server.started))
+
+    def list_tools(self):
+        tools = []
+        for server in self.servers.values():
+            self._run(server.ensure_started())
+            tools.extend((server.name, tool) for tool in server.tools)
+        return tools
+
+    def call(self, server_name, tool_name, arguments):
+        return self._run(self.servers[server_name].call_tool(tool_name, arguments))
+
+    def stats(self):
+        return {name: server.stats() for name, server in self.servers.items()}
+
+    def close(self):
+        self._health.cancel()
+        self._run(asyncio.gather(*(server.shutdown() for server in self.servers.values())))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+class PooledMCPTool(BaseTool):
+    """A Qwen-Agent tool that forwards calls to a server in an MCPServerPool; named ``<server>-<tool>`` like Qwen-Agent's own MCP tools."""
+
+    def __init__(self, pool, server_name, tool):
+        self.pool = pool
+        self.server_name = server_name
+        self.tool_name = tool.name
+        self.name = f"{server_name}-{tool.name}"
+        self.description = tool.description or ""
+        self.parameters = tool.inputSchema
+        super().__init__()
+
+    def call(self, params: Union[str, dict], **kwargs) -> str:
+        arguments = self._verify_json_format_args(params)
+        try:
+            result = self.pool.call(self.server_name, self.tool_name, arguments)
+        except McpError as exc:
+            return ToolError(f"Error: {exc}")
+        text = "\n\n".join(item.text for item in result.content if getattr(item, "type", None) == "text")
+        # servers report tool failures (a fetch that got a 503, ...) in the result, not as an exception
+        return ToolError(f"Error: {text}") if result.isError else text
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(servers: Dict[str, dict], **pool_kwargs) -> MCPServerPool:
+    key = json.dumps(servers, sort_keys=True)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = MCPServerPool(servers, **pool_kwargs)
+        return _pools[key]
+
+
+def pooled_function_list(function_list: List, **pool_kwargs) -> List:
+    # Replace ``{"mcpServers": {...}}`` entries of a Qwen-Agent function list with tools served by the shared pool.
+    tools = []
+    for item in function_list:
+        if isinstance(item, dict) and "mcpServers" in item:
+            pool = get_pool(item["mcpServers"], **pool_kwargs)
+            start = time.perf_counter()
+            tools.extend(PooledMCPTool(pool, server_name, tool) for server_name, tool in pool.list_tools())
+            print(f"✅ {len(pool.servers)} MCP servers ready in {time.perf_counter() - start:.1f} s")
+        else:
+            tools.append(item)
+    return tools
@@ -0,0 +1,90 @@
+# shared_weights.py
+# Qompass AI - Per-process shared/unique memory report for model workers
+# Copyright (C) 2025 Qompass AI, All rights reserved
+# ----------------------------------------
+import argparse
+import os
+from pathlib import Path
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def _smaps_totals(lines, path_filter=None):
+    totals = dict.fromkeys(SMAPS_FIELDS, 0)
+    include = path_filter is None
+    for line in lines:
+        name, _, rest = line.partition(":")
+        if name in totals:
+            if include:
+                totals[name] += int(rest.split()[0]) * 1024
+        elif path_filter is not None and "-" in name.split(" ")[0]:
+            # a mapping header: "start-end perms offset dev inode path"
+            fields = line.split()
+            include = len(fields) >= 6 and path_filter(fields[-1])
+    return totals
+
+
+def memory_report(pid="self", weights_dir=None):
+    """USS (private), shared and PSS bytes of a process, plus the part coming from ``.bin`` files in ``weights_dir``."""
+    proc = Path("/proc") / str(pid)
+    if (proc / "smaps_rollup").exists():
+        totals = _smaps_totals((proc / "smaps_rollup").read_text().splitlines())
+    else:
+        import psutil
+
+        info = psutil.Process(None if pid == "self" else int(pid)).memory_full_info()
+        return {"rss": info.rss, "uss": info.uss, "pss": getattr(info, "pss", 0), "shared": info.shared}
+    report = {
+        "rss": totals["Rss"],
+        "uss": totals["Private_Clean"] + totals["Private_Dirty"],
+        "pss": totals["Pss"],
+        "shared": totals["Shared_Clean"] + totals["Shared_Dirty"],
+    }
+    if weights_dir is not None:
+        weights_dir = str(Path(weights_dir).resolve())
+        weights = _smaps_totals((proc / "smaps").read_text().splitlines(), lambda path: path.startswith(weights_dir) and path.endswith(".bin"))
+        report["weights_rss"] = weights["Rss"]
+        report["weights_shared"] = weights["Shared_Clean"] + weights["Shared_Dirty"]
+        report["weights_private"] = weights["Private_Clean"] + weights["Private_Dirty"]
+    return report
+
+
+def find_pids(pattern):
+    pids = []
+    for proc in Path("/proc").iterdir():
+        if proc.name.isdigit() and int(proc.name) != os.getpid():
+            try:
+                if pattern in (proc / "cmdline").read_bytes().replace(b"\0", b" ").decode(errors="replace"):
+                    pids.append(int(proc.name))
+            except OSError:
+                continue
+    return sorted(pids)
+
+
+def print_memory_report(pids, weights_dir=None):
+    mib = 1024**2
+    columns = ["rss", "uss", "shared", "pss"] + (["weights_rss", "weights_shared", "weights_private"] if weights_dir else [])
+    print("pid".rjust(8) + "".join(f"{name + ', MB':>18}" for name in columns))
+    totals = dict.fromkeys(columns, 0)
+    for pid in pids:
+        try:
+            report = memory_report(pid, weights_dir)
+        except OSError:
+            continue
+        print(str(pid).rjust(8) + "".join(f"{report.get(name, 0) / mib:>18.1f}" for name in columns))
+        for name in columns:
+            totals[name] += report.get(name, 0)
+    # summed PSS is what the workers really cost together; summed RSS counts shared pages once per process
+    print("total".rjust(8) + "".join(f"{totals[name] / mib:>18.1f}" for name in columns))
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-process unique vs shared memory of model worker processes")
+    parser.add_argument("pids", nargs="*", type=int, help="Worker process ids")
+    parser.add_argument("-p", "--pattern", default=None, help="Report every process whose command line contains this text, e.g. mcp_demo.py")
+    parser.add_argument("-m", "--model_dir", default=None, help="Also break out memory mapped from this model directory's .bin files")
+    args = parser.parse_args()
+
+    pids = args.pids or find_pids(args.pattern or "mcp_demo.py")
+    print_memory_report(pids, args.model_dir)
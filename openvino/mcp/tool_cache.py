@@ -0,0 +1,128 @@
+# tool_cache.py
+# Qompass AI - TTL cache for idempotent MCP agent tool results
+# Copyright (C) 2025 Qompass AI, All rights reserved
+# ----------------------------------------
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Union
+
+from qwen_agent.tools.base import BaseTool
+
+# not idempotent (code execution) or not deterministic (the current time)
+DEFAULT_EXCLUDE = ("code_interpreter", "time-get_current_time")
+
+
+class ToolError(str):
+    """A tool result that reports a failed call; returned as text to the model but never cached."""
+
+
+def canonical_arguments(params: Union[str, dict]) -> str:
+    if isinstance(params, str):
+        try:
+            params = json.loads(params)
+        except ValueError:
+            return params.strip()
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+class ToolResultCache:
+    """Per-tool TTL/LRU cache of tool results keyed by canonicalized arguments.
+
+    ``policies`` maps a tool name to ``{"ttl": seconds, "max_entries": n}`` overriding the defaults; a ttl of 0 or a
+    name in ``exclude`` turns caching off for that tool.
+    """
+
+    def __init__(self, ttl=300, max_entries=256, policies: Optional[Dict[str, dict]] = None, exclude: Iterable[str] = DEFAULT_EXCLUDE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.policies = dict(policies or {})
+        self.exclude = set(exclude)
+        self._entries = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def policy(self, tool_name):
+        policy = {"ttl": self.ttl, "max_entries": self.max_entries, **self.policies.get(tool_name, {})}
+        if tool_name in self.exclude:
+            policy["ttl"] = 0
+        return policy
+
+    def cacheable(self, tool_name):
+        return self.policy(tool_name)["ttl"] > 0
+
+    def _tool_stats(self, tool_name):
+        return self._stats.setdefault(tool_name, {"hits": 0, "misses": 0, "expired": 0, "evictions": 0})
+
+    def get(self, tool_name, key):
+        with self._lock:
+            stats = self._tool_stats(tool_name)
+            entries = self._entries.get(tool_name, {})
+            entry = entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del entries[key]
+                stats["expired"] += 1
+                entry = None
+            if entry is None:
+                stats["misses"] += 1
+                return None
+            entries.move_to_end(key)
+            stats["hits"] += 1
+            return entry[1]
+
+    def put(self, tool_name, key, result):
+        policy = self.policy(tool_name)
+        with self._lock:
+            entries = self._entries.setdefault(tool_name, OrderedDict())
+            entries[key] = (time.monotonic() + policy["ttl"], result)
+            entries.move_to_end(key)
+            while len(entries) > policy["max_entries"]:
+                entries.popitem(last=False)
+                self._tool_stats(tool_name)["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {name: {**counts, "entries": len(self._entries.get(name, ()))} for name, counts in self._stats.items()}
+        hits = sum(counts["hits"] for counts in stats.values())
+        lookups = hits + sum(counts["misses"] for counts in stats.values())
+        return {"hits": hits, "misses": lookups - hits, "hit_rate": hits / lookups if lookups else 0.0, "tools": stats}
+
+
+class CachedTool(BaseTool):
+    """Wraps a Qwen-Agent tool so repeated calls with the same arguments are answered from a ToolResultCache."""
+
+    def __init__(self, tool: BaseTool, cache: ToolResultCache):
+        self.tool = tool
+        self.cache = cache
+        self.name = tool.name
+        self.description = tool.description
+        self.parameters = tool.parameters
+        super().__init__()
+
+    def __getattr__(self, name):
+        return getattr(self.tool, name)
+
+    def call(self, params: Union[str, dict], **kwargs):
+        key = canonical_arguments(params)
+        result = self.cache.get(self.name, key)
+        if result is not None:
+            return result
+        result = self.tool.call(params, **kwargs)
+        # a failure is an answer about this attempt, not about the arguments: keep it out of the cache
+        if not isinstance(result, ToolError):
+            self.cache.put(self.name, key, result)
+        return result
+
+
+def cache_tool_results(agent, cache: Optional[ToolResultCache] = None) -> ToolResultCache:
+    # Wrap every cacheable tool of a Qwen-Agent agent in place; returns the cache for its stats.
+    cache = cache or ToolResultCache()
+    for name, tool in list(agent.function_map.items()):
+        if cache.cacheable(name) and not isinstance(tool, CachedTool):
+            agent.function_map[name] = CachedTool(tool, cache)
+    return cache